@@ -9,7 +9,7 @@ from pydantic import BaseModel
 
 router = APIRouter()
 
-from app.api.v1.tasks import get_current_user
+from app.core.deps import get_current_user
 
 class AchievementResponse(BaseModel):
     id: str
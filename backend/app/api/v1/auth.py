@@ -4,6 +4,7 @@ from app.core.database import get_db
 from app.models.user import User
 from app.schemas.user import UserCreate, UserResponse, UserLogin, Token
 from app.core.security import get_password_hash, verify_password, create_access_token
+from app.core.email import outbox_worker, queue_welcome_email
 
 router = APIRouter()
 
@@ -21,8 +22,11 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         avatar_url="https://api.dicebear.com/7.x/avataaars/svg?seed=" + user.email # Auto-generate cartoon avatar
     )
     db.add(new_user)
+    db.flush()  # assigns the id the welcome mail is keyed on
+    queue_welcome_email(db, new_user.id, new_user.email, new_user.full_name)
     db.commit()
     db.refresh(new_user)
+    outbox_worker.kick()
     return new_user
 
 @router.post("/login", response_model=Token)
@@ -37,24 +41,7 @@ def login_for_access_token(user_in: UserLogin, db: Session = Depends(get_db)):
     access_token = create_access_token(subject=user.id)
     return {"access_token": access_token, "token_type": "bearer"}
 
-from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-from app.core.config import settings
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    return user
+from app.core.deps import get_current_user, invalidate_user, invalidate_memberships
 
 @router.get("/me", response_model=UserResponse)
 def read_users_me(current_user: User = Depends(get_current_user)):
@@ -76,39 +63,40 @@ def update_user_profile(updates: UserUpdate, current_user: User = Depends(get_cu
     db.add(current_user)
     db.commit()
     db.refresh(current_user)
+    invalidate_user(current_user.id)
     return current_user
 
 @router.delete("/me")
 def delete_user_account(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Delete user (cascading should handle related data if configured)
+    user_id = current_user.id
     db.delete(current_user)
     db.commit()
+    invalidate_user(user_id)
+    invalidate_memberships(user_id)
     return {"message": "Account deleted successfully"}
 
 from fastapi import UploadFile, File
-import shutil
-import os
+from fastapi.concurrency import run_in_threadpool
+from app.core.uploads import store_image
+from app.core.images import image_pipeline
 
 @router.post("/me/avatar")
 async def upload_avatar(file: UploadFile = File(...), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Validate extension
-    ext = file.filename.split(".")[-1].lower()
-    if ext not in ["jpg", "jpeg", "png", "gif", "webp"]:
-        raise HTTPException(status_code=400, detail="Invalid image format")
-        
-    filename = f"{current_user.id}.{ext}"
-    file_path = f"app/static/avatars/{filename}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
+    # Streamed to disk off the event loop, named by content hash
+    stored = await store_image(file, "app/static/avatars")
+
     # Update URL
     # Hardcoding localhost for demo, in prod use Env var
     base_url = "http://localhost:8000"
-    current_user.avatar_url = f"{base_url}/static/avatars/{filename}"
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-    
-    return {"avatar_url": current_user.avatar_url}
+    current_user.avatar_url = f"{base_url}/api/v1/media/avatars/{stored.filename}"  # ?size=thumb|medium for variants
+    image_pipeline.submit(stored.path)
 
+    def save():
+        db.add(current_user)
+        db.commit()
+        db.refresh(current_user)
+    await run_in_threadpool(save)
+    invalidate_user(current_user.id)
+
+    return {"avatar_url": current_user.avatar_url}
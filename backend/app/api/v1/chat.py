@@ -1,76 +1,278 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from app.core.database import get_db, SessionLocal
 from app.models.chat import Message
-from app.models.user import User
+from app.models.user import User, generate_uuid
 
-from app.core.security import settings
-from jose import jwt, JWTError
-from typing import List, Dict
+from app.core.deps import get_current_user, resolve_user
+from app.core.broker import Broker, create_broker
+from app.core.config import settings
+from app.core.persister import message_persister
+from typing import Awaitable, Callable, Dict, Optional
+from collections import deque
+import asyncio
 import json
+from datetime import datetime
+from functools import partial
 
 router = APIRouter()
 
+def frame_id(payload: str) -> Optional[str]:
+    frame = json.loads(payload)
+    return frame.get("id") if isinstance(frame, dict) else None
+
+class ClientConnection:
+    """
+    One socket plus its bounded outbound queue, drained by a dedicated writer task.
+    A slow client only ever blocks its own writer, never the broadcast loop.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+        # Live frames held back until the history replay is queued (None once live)
+        self.held: Optional[list] = []
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def offer(self, payload: str) -> bool:
+        """Queue without waiting. False means the client is dead or too far behind."""
+        if self.closed:
+            return False
+        if self.held is not None:
+            if self.queue.maxsize and len(self.held) >= self.queue.maxsize:
+                return False
+            self.held.append(payload)
+            return True
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def send(self, payload: str):
+        # For messages addressed to this client only (history replay): wait for room instead of evicting
+        await self.queue.put(payload)
+
+    async def replay(self, payloads: list):
+        """
+        Queue the history replay, then the live frames that arrived meanwhile, and go live.
+        Held frames the replay already contains are dropped, so nothing is sent twice.
+        """
+        replayed = {frame_id(p) for p in payloads}
+        for payload in payloads:
+            await self.send(payload)
+        while self.held:
+            payload = self.held.pop(0)
+            if frame_id(payload) not in replayed:
+                await self.send(payload)
+        self.held = None
+
+    async def _write_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.closed = True
+
+    async def close(self, code: int = None):
+        self.closed = True
+        self.writer.cancel()
+        if code is not None:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+
+# One-character prefix on broker payloads, stripped before frames reach sockets
+HISTORY_FRAME = "h"
+TRANSIENT_FRAME = "t"
+
 class ConnectionManager:
-    def __init__(self):
-        # group_id -> List[WebSocket]
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    """
+    Local sockets per group, with fan-out going through a broker so that every worker
+    holding listeners for the group receives the message.
+    """
+
+    def __init__(
+        self,
+        broker: Broker = None,
+        max_queue: int = settings.CHAT_SEND_QUEUE_SIZE,
+        history_size: int = settings.CHAT_HISTORY_SIZE,
+    ):
+        # group_id -> {WebSocket: ClientConnection} (this worker only; dict for O(1) removal)
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.broker = broker or create_broker()
+        self.max_queue = max_queue
+        self.evicted = 0
+        # group_id -> last serialized frames. Only kept while subscribed, since that is
+        # what guarantees every new message reaches the buffer.
+        self.recent: Dict[str, deque] = {}
+        self.history_size = history_size
+        self._warming: Dict[str, asyncio.Future] = {}
+        # group_id -> frames delivered while the buffer is being loaded from the DB
+        self._arrived: Dict[str, deque] = {}
+        self.replay_hits = 0
+        self.replay_misses = 0
 
-    async def connect(self, websocket: WebSocket, group_id: str):
+    @staticmethod
+    def channel(group_id: str) -> str:
+        return f"chat:{group_id}"
+
+    async def connect(self, websocket: WebSocket, group_id: str) -> ClientConnection:
         await websocket.accept()
         if group_id not in self.active_connections:
-            self.active_connections[group_id] = []
-        self.active_connections[group_id].append(websocket)
+            self.active_connections[group_id] = {}
+            await self.broker.subscribe(self.channel(group_id), self._deliver)
+        connection = ClientConnection(websocket, self.max_queue)
+        self.active_connections[group_id][websocket] = connection
+        return connection
+
+    async def disconnect(self, websocket: WebSocket, group_id: str, code: int = None):
+        connections = self.active_connections.get(group_id)
+        if connections is None:
+            return
+        connection = connections.pop(websocket, None)
+        if connection is not None:
+            await connection.close(code)
+        if not connections:
+            del self.active_connections[group_id]
+            self.recent.pop(group_id, None)
+            await self.broker.unsubscribe(self.channel(group_id), self._deliver)
+
+    async def broadcast(self, message: dict, group_id: str, history: bool = True):
+        """
+        Serialized once here; every worker and socket reuses the same string.
+        history=False marks transient frames (e.g. streaming chunks) that must not be replayed.
+        """
+        kind = HISTORY_FRAME if history else TRANSIENT_FRAME
+        await self.broker.publish(self.channel(group_id), kind + json.dumps(message))
 
-    def disconnect(self, websocket: WebSocket, group_id: str):
-        if group_id in self.active_connections:
-            self.active_connections[group_id].remove(websocket)
-            if not self.active_connections[group_id]:
-                del self.active_connections[group_id]
+    async def _deliver(self, channel: str, payload: str):
+        # Broker callback: enqueue to this worker's sockets, evicting the ones that can't keep up
+        group_id = channel.split(":", 1)[1]
+        connections = self.active_connections.get(group_id)
+        if not connections:
+            return
+        kind, payload = payload[0], payload[1:]
+        if kind == HISTORY_FRAME:
+            buffer = self.recent.get(group_id, self._arrived.get(group_id))
+            if buffer is not None:
+                buffer.append(payload)
+        lagging = [ws for ws, conn in connections.items() if not conn.offer(payload)]
+        for websocket in lagging:
+            self.evicted += 1
+            await self.disconnect(websocket, group_id, code=1013)  # Try Again Later
 
-    async def broadcast(self, message: dict, group_id: str):
-        if group_id in self.active_connections:
-            for connection in self.active_connections[group_id]:
-                await connection.send_json(message)
+    async def recent_messages(self, group_id: str, loader: Callable[[str, int], Awaitable[list]]) -> list:
+        """
+        Frames to replay on connect. Served from the buffer when warm; otherwise one
+        `loader(group_id, limit)` call is shared by every socket connecting meanwhile.
+        Frames delivered while it runs are collected and merged in, so none are lost.
+        """
+        buffer = self.recent.get(group_id)
+        if buffer is not None:
+            self.replay_hits += 1
+            return list(buffer)
+        pending = self._warming.get(group_id)
+        if pending is not None:
+            self.replay_hits += 1
+            return await asyncio.shield(pending)
+
+        self.replay_misses += 1
+        arrived = self._arrived[group_id] = deque(maxlen=self.history_size)
+        pending = asyncio.ensure_future(loader(group_id, self.history_size))
+        self._warming[group_id] = pending
+        try:
+            loaded = await asyncio.shield(pending)
+        finally:
+            self._warming.pop(group_id, None)
+            self._arrived.pop(group_id, None)
+
+        # Loaded rows are older than anything delivered since; skip the ones both have
+        loaded_ids = {json.loads(p).get("id") for p in loaded}
+        payloads = loaded + [p for p in arrived if json.loads(p).get("id") not in loaded_ids]
+        payloads = payloads[-self.history_size:]
+        if group_id in self.active_connections and group_id not in self.recent:
+            self.recent[group_id] = deque(payloads, maxlen=self.history_size)
+        return payloads
+
+    def stats(self) -> dict:
+        return {
+            "groups": len(self.active_connections),
+            "connections": sum(len(c) for c in self.active_connections.values()),
+            "evicted": self.evicted,
+            "replay_hits": self.replay_hits,
+            "replay_misses": self.replay_misses,
+        }
 
 manager = ConnectionManager()
 
-# Helper to get user from token in WebSocket
-def get_user_from_token(token: str, db: Session):
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-        return db.query(User).filter(User.id == user_id).first()
-    except JWTError:
-        return None
+def message_frame(msg: Message, sender_name: Optional[str]) -> dict:
+    return {
+        "id": msg.id,
+        "content": msg.content,
+        "sender_id": msg.sender_id,
+        "sender_name": sender_name or "Unknown",
+        "created_at": str(msg.created_at)
+    }
+
+def query_history(db: Session, group_id: str, cursor: tuple = None, limit: int = 50) -> list:
+    """
+    One keyset page of messages older than `cursor` ((created_at, id), id may be None),
+    sender names joined in, returned oldest first. Served by ix_messages_group_created.
+    """
+    query = db.query(Message, User.full_name).outerjoin(User, User.id == Message.sender_id)\
+              .filter(Message.group_id == group_id)
+    if cursor is not None:
+        created_at, message_id = cursor
+        if message_id is None:
+            query = query.filter(Message.created_at < created_at)
+        else:
+            query = query.filter(or_(
+                Message.created_at < created_at,
+                and_(Message.created_at == created_at, Message.id < message_id)
+            ))
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()
+    rows.reverse()
+    return [message_frame(msg, sender_name) for msg, sender_name in rows]
+
+def authenticate_socket(token: str) -> Optional[User]:
+    # Short-lived session: a principal cache hit never checks out a pool connection,
+    # and a miss returns its connection as soon as the lookup is done.
+    with SessionLocal() as db:
+        return resolve_user(token, db)  # detached afterwards, loaded columns stay readable
+
+def query_recent_frames(group_id: str, limit: int) -> list:
+    with SessionLocal() as db:
+        return [json.dumps(m) for m in query_history(db, group_id, limit=limit)]
+
+async def load_recent_frames(group_id: str, limit: int) -> list:
+    # Messages still queued in this worker's write-behind persister must be in the DB first
+    await message_persister.flush()
+    return await asyncio.to_thread(query_recent_frames, group_id, limit)
 
 @router.websocket("/{group_id}")
 async def websocket_endpoint(websocket: WebSocket, group_id: str, token: str):
-    # Since we can't inject DB into WS easily, use SessionLocal
-    db = SessionLocal()
-    user = get_user_from_token(token, db)
+    # No session is held for the socket's lifetime; each DB operation opens its own.
+    user = await asyncio.to_thread(authenticate_socket, token)
     
     if not user:
         await websocket.close(code=4003)
         return
 
-    await manager.connect(websocket, group_id)
+    connection = await manager.connect(websocket, group_id)
     try:
-        # Send history? Optional. For now let's just do real-time.
-        # Actually, let's load last 50 messages
-        messages = db.query(Message).filter(Message.group_id == group_id).order_by(Message.created_at.asc()).limit(50).all()
-        for msg in messages:
-            await websocket.send_json({
-                "content": msg.content,
-                "sender_id": msg.sender_id,
-                "sender_name": msg.sender.full_name, # Lazy load might fail if session closed? No, session open.
-                "created_at": str(msg.created_at)
-            })
-
-
-        while True:
+        # Replay recent history, from the in-memory buffer when this worker already has it
+        # Live frames are held until the replay is queued, so history always comes first
+        recent = await manager.recent_messages(group_id, load_recent_frames)
+        await connection.replay(recent)
+
+        while not connection.closed:
             data = await websocket.receive_text()
             
             # Parse JSON message
@@ -80,161 +282,201 @@ async def websocket_endpoint(websocket: WebSocket, group_id: str, token: str):
             except:
                 content = data
             
-            # Save to DB
-            new_msg = Message(content=content, sender_id=user.id, group_id=group_id)
-            db.add(new_msg)
-            db.commit()
+            # Save to DB (write-behind, batched with other senders)
+            new_msg = {
+                "id": generate_uuid(),
+                "content": content,
+                "sender_id": user.id,
+                "group_id": group_id,
+                "created_at": datetime.utcnow(),
+            }
+            await message_persister.submit(new_msg)
             
             # Broadcast
             await manager.broadcast({
+                "id": new_msg["id"],
                 "content": content,
                 "sender_id": user.id,
                 "sender_name": user.full_name,
-                "created_at": str(new_msg.created_at)
+                "created_at": str(new_msg["created_at"])
             }, group_id)
             
-            # Check for AI trigger
+            # Check for AI trigger (runs in the background, this socket keeps receiving)
             if content.lower().startswith("homie") or "@homie" in content.lower():
-                await handle_ai_command(content, group_id, db, manager, user)
+                if not ai_jobs.submit(group_id, partial(handle_ai_command, content, group_id, manager, user, new_msg["id"])):
+                    connection.offer(json.dumps(homie_busy_frame()))
 
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket, group_id)
+        pass
     finally:
-        db.close()
+        await manager.disconnect(websocket, group_id)
 
-from app.core.ai import get_homie_response
+from app.core.ai import get_homie_response, stream_homie_response
+from app.core.context import build_context
+from app.core.jobs import BoundedJobQueue
 from app.models.task import Task
 from app.models.expense import Expense
+from app.core.balances import record_expense
+from app.core import analytics
+from app.schemas.expense import ExpenseCreate
+from app.schemas.task import TaskCreate
+from pydantic import ValidationError
 
-async def handle_ai_command(content: str, group_id: str, db: Session, manager: ConnectionManager, user: User):
-    # Trigger AI
-    ai_res = await get_homie_response(content)
-    
-    # Send AI Text reply
-    if ai_res.get("text"):
-        ai_msg = Message(content=ai_res["text"], sender_id="ai_homie", group_id=group_id)
-        # We need a dummy user for AI or just handle sender_id="ai_homie" in frontend
-        # For DB integrity, we might need a system user or nullable sender_id.
-        # Let's assume sender_id can be 'ai_homie' if column allows string (it does).
-        # But foreign key constraint on users.id might fail.
-        # Fix: Create a system user or make sender_id nullable?
-        # Better: use a dedicated System User created at startup.
-        # Short term hack for demo: Find ANY user or use the current user as proxy? No.
-        # Let's just broadcast without saving to DB for AI right now to avoid FK error, 
-        # OR handle "sender_id=None" if model allows.
-        # Model user.py: sender_id = Column(String, ForeignKey("users.id"))
-        # we can't insert random string.
-        # Workaround: Retrieve the "System AI" user. If not exists, create it.
-        
-        system_user = db.query(User).filter(User.email == "homie@ai.com").first()
+# Homie requests run here, never inline in a socket's receive loop
+ai_jobs = BoundedJobQueue(
+    max_concurrency=settings.AI_MAX_CONCURRENCY,
+    max_pending=settings.AI_MAX_PENDING,
+    per_key=settings.AI_PER_GROUP_CONCURRENCY,
+    timeout=settings.AI_TIMEOUT_SECONDS,
+    name="Homie",
+)
+
+HOMIE_EMAIL = "homie@ai.com"
+HOMIE_NAME = "Homie 🤖"
+_homie_id: Optional[str] = None
+
+def get_homie_id(db: Session) -> str:
+    """
+    Homie posts as a dedicated system user so Message.sender_id keeps its FK to users.
+    Created on first use, then remembered for the life of the process.
+    """
+    global _homie_id
+    if _homie_id is None:
+        system_user = db.query(User).filter(User.email == HOMIE_EMAIL).first()
         if not system_user:
-            # Create on fly (not ideal for async but okay for demo)
-            from app.models.user import User
-            system_user = User(email="homie@ai.com", full_name="Homie 🤖", hashed_password="x", avatar_url="https://api.dicebear.com/7.x/bottts/svg?seed=Homie")
+            system_user = User(email=HOMIE_EMAIL, full_name=HOMIE_NAME, hashed_password="x", avatar_url="https://api.dicebear.com/7.x/bottts/svg?seed=Homie")
             db.add(system_user)
             db.commit()
-            db.refresh(system_user)
-            
-        ai_msg = Message(content=ai_res["text"], sender_id=system_user.id, group_id=group_id)
-        db.add(ai_msg)
+        _homie_id = system_user.id
+    return _homie_id
+
+def tool_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+def apply_ai_result(ai_res: dict, group_id: str, user_id: str) -> list:
+    """
+    Persist Homie's reply, the rows its tool calls create and their confirmation
+    messages in a single transaction. Tool calls whose arguments don't validate are
+    skipped with a warning line instead. Returns the frames to broadcast after commit.
+    """
+    with SessionLocal() as db:
+        homie_id = get_homie_id(db)
+        replies = []
+        if ai_res.get("text"):
+            replies.append(ai_res["text"])
+
+        for tool in ai_res.get("tool_calls", []):
+            name = tool.get("name") or tool.get("tool")
+            args = tool.get("parameters") or tool.get("args") or {}
+            if name == "create_task":
+                due_date = None
+                if args.get("due_date"):
+                    try:
+                        due_date = datetime.fromisoformat(args["due_date"])
+                    except (TypeError, ValueError):
+                        pass
+                fields = {k: args.get(k) for k in ("title", "priority", "points") if args.get(k) is not None}
+                try:
+                    task = TaskCreate.model_validate(dict(fields, due_date=due_date))
+                except ValidationError as e:
+                    replies.append(f"⚠️ Couldn't create that task ({tool_error(e)})")
+                    continue
+                new_task = Task(
+                    title=task.title,
+                    priority=task.priority,
+                    points=task.points,
+                    due_date=task.due_date,
+                    group_id=group_id,
+                    created_by_id=user_id # Created by user who asked
+                )
+                db.add(new_task)
+                replies.append(f"✅ Created task: {new_task.title}")
+            elif name == "create_expense":
+                fields = {k: args.get(k) for k in ("description", "amount", "category") if args.get(k) is not None}
+                try:
+                    expense = ExpenseCreate.model_validate({"category": "General", **fields})
+                except ValidationError as e:
+                    replies.append(f"⚠️ Couldn't add that expense ({tool_error(e)})")
+                    continue
+                new_expense = Expense(
+                    description=expense.description,
+                    amount=expense.amount,
+                    category=expense.category,
+                    group_id=group_id,
+                    paid_by_id=user_id
+                )
+                db.add(new_expense)
+                record_expense(db, group_id, user_id, new_expense.amount)
+                analytics.record_expense(db, new_expense)
+                replies.append(f"💸 Added expense: ${new_expense.amount} for {new_expense.description}")
+
+        frames = []
+        for text in replies:
+            msg = Message(id=generate_uuid(), content=text, sender_id=homie_id, group_id=group_id, created_at=datetime.utcnow())
+            db.add(msg)
+            frames.append(message_frame(msg, HOMIE_NAME))
         db.commit()
-        
-        await manager.broadcast({
-            "content": ai_msg.content,
-            "sender_id": system_user.id,
-            "sender_name": system_user.full_name,
-            "created_at": str(ai_msg.created_at)
-        }, group_id)
-
-    # Process Tools
-    for tool in ai_res.get("tool_calls", []):
-        if tool["name"] == "create_task":
-            args = tool["parameters"] if "parameters" in tool else tool["args"]
-            new_task = Task(
-                title=args.get("title"),
-                priority=args.get("priority", "medium"),
-                points=args.get("points", 10),
-                group_id=group_id,
-                created_by_id=user.id # Created by user who asked
-            )
-            db.add(new_task)
-            db.commit()
-            
-            # Announce
-            check_msg = Message(content=f"✅ Created task: {new_task.title}", sender_id=system_user.id, group_id=group_id)
-            db.add(check_msg)
-            db.commit()
-            await manager.broadcast({
-                "content": check_msg.content,
-                "sender_id": system_user.id,
-                "sender_name": system_user.full_name,
-                "created_at": str(check_msg.created_at)
-            }, group_id)
-            
-        elif tool["name"] == "create_expense":
-            args = tool["parameters"] if "parameters" in tool else tool["args"]
-            new_expense = Expense(
-                 description=args.get("description"),
-                 amount=float(args.get("amount")),
-                 category=args.get("category", "General"),
-                 group_id=group_id,
-                 paid_by_id=user.id
-            )
-            db.add(new_expense)
-            db.commit()
-            
-            check_msg = Message(content=f"💸 Added expense: ${new_expense.amount} for {new_expense.description}", sender_id=system_user.id, group_id=group_id)
-            db.add(check_msg)
-            db.commit()
-            await manager.broadcast({
-                "content": check_msg.content,
-                 "sender_id": system_user.id,
-                "sender_name": system_user.full_name,
-                "created_at": str(check_msg.created_at)
-            }, group_id)
+    return frames
 
-from fastapi import HTTPException
-from fastapi.security import OAuth2PasswordBearer
+async def handle_ai_command(content: str, group_id: str, manager: ConnectionManager, user: User, message_id: str = None):
+    # Context comes from the replay buffer (no per-command history query)
+    recent = await manager.recent_messages(group_id, load_recent_frames)
+    excerpt, history = build_context(group_id, recent, exclude_id=message_id)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+    stream_id = None
+    if settings.AI_STREAMING:
+        # Partial text goes out as transient chunk frames; the persisted reply follows as
+        # a homie_final frame with the same stream_id
+        stream_id = generate_uuid()
+        ai_res = None
+        async for event in stream_homie_response(content, history, excerpt, group_id=group_id):
+            if "delta" in event:
+                await manager.broadcast({
+                    "type": "homie_chunk",
+                    "stream_id": stream_id,
+                    "delta": event["delta"],
+                    "sender_id": "ai_homie",
+                    "sender_name": HOMIE_NAME
+                }, group_id, history=False)
+            else:
+                ai_res = event
+    else:
+        ai_res = await get_homie_response(content, history, excerpt, group_id=group_id)
 
-def get_current_user_from_token(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    return user
+    frames = await asyncio.to_thread(apply_ai_result, ai_res, group_id, user.id)
+    if stream_id and frames and ai_res.get("text"):
+        frames[0].update(type="homie_final", stream_id=stream_id, tool_calls=ai_res.get("tool_calls", []))
+    for frame in frames:
+        await manager.broadcast(frame, group_id)
+
+def homie_busy_frame() -> dict:
+    # Sent only to the asking socket, not persisted
+    return {
+        "content": "I'm swamped right now, ask me again in a moment! 😅",
+        "sender_id": "ai_homie",
+        "sender_name": HOMIE_NAME,
+        "created_at": str(datetime.utcnow())
+    }
 
 @router.get("/{group_id}/history")
-async def get_chat_history(
+def get_chat_history(
     group_id: str,
-    current_user: User = Depends(get_current_user_from_token),
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get last 50 messages for a group"""
-    messages = db.query(Message).filter(
-        Message.group_id == group_id
-    ).order_by(Message.created_at.desc()).limit(50).all()
-    
-    # Reverse to show oldest first
-    messages.reverse()
-    
-    result = []
-    for msg in messages:
-        sender = db.query(User).filter(User.id == msg.sender_id).first()
-        result.append({
-            "content": msg.content,
-            "sender_id": msg.sender_id,
-            "sender_name": sender.full_name if sender else "Unknown",
-            "created_at": str(msg.created_at)
-        })
-    
-    return result
+    """Get a page of messages older than `before` (a message id or ISO timestamp), oldest first"""
+    cursor = None
+    if before:
+        ref = db.query(Message.created_at, Message.id).filter(Message.id == before, Message.group_id == group_id).first()
+        if ref:
+            cursor = (ref.created_at, ref.id)
+        else:
+            try:
+                cursor = (datetime.fromisoformat(before), None)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return query_history(db, group_id, cursor, limit)
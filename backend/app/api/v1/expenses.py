@@ -1,26 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.core.database import get_db
-from app.models.expense import Expense
-from app.models.user import User, GroupMember
-from app.schemas.expense import ExpenseCreate, ExpenseResponse
-from app.api.v1.groups import get_current_user_dep
+import json
+from app.models.expense import Expense, ExpenseArchive, ExpenseRollup, Settlement, Subscription
+from app.models.user import User
+from app.schemas.expense import ExpenseCreate, ExpenseResponse, ExpenseSummary, ExpenseTotal, SettlementResponse, ExpenseAnalytics, MonthTotal, SubscriptionResponse
+from datetime import datetime
+from decimal import Decimal
+from app.core.deps import get_current_user, get_group_context, GroupContext
+from app.core import analytics, balances
+from app.core.settlements import settle, settlement_archiver
+from app.core.config import settings
 
 router = APIRouter()
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from app.core.email import send_bill_reminder
+from app.core.email import outbox_worker, queue_bill_reminder
 
 @router.post("/", response_model=ExpenseResponse)
 def create_expense(
     expense: ExpenseCreate, 
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user_dep), 
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user), 
+    db: Session = Depends(get_db),
+    membership: Optional[GroupContext] = Depends(get_group_context)
 ):
     # Find user's group (Assuming 1 group for now as per dashboard logic)
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
     if not membership:
         raise HTTPException(status_code=400, detail="User is not in a group")
         
@@ -33,29 +38,51 @@ def create_expense(
         paid_by_id=current_user.id,
         group_id=membership.group_id
     )
+    if expense.is_subscription:
+        # This expense is the current month's charge; the billing run adds the following ones
+        period = datetime.utcnow().date().replace(day=1)
+        new_expense.billing_day = expense.billing_day or datetime.utcnow().day
+        subscription = Subscription(
+            group_id=membership.group_id,
+            paid_by_id=current_user.id,
+            description=expense.description,
+            amount=expense.amount,
+            category=expense.category,
+            billing_day=new_expense.billing_day,
+            last_billed_period=period,
+        )
+        db.add(subscription)
+        db.flush()
+        new_expense.subscription_id = subscription.id
+        new_expense.billing_period = period
     db.add(new_expense)
-    db.commit()
-    db.refresh(new_expense)
+    balances.record_expense(db, membership.group_id, current_user.id, new_expense.amount)
+    analytics.record_expense(db, new_expense)
 
-    # Send email reminder confirmation for subscription
+    # Email reminder confirmation for subscription, queued with the expense
     if new_expense.is_subscription:
-        background_tasks.add_task(
-            send_bill_reminder,
+        queue_bill_reminder(
+            db,
             current_user.email,
             current_user.full_name,
             new_expense.description,
             new_expense.amount,
-            f"Day {new_expense.billing_day} of every month"
+            f"Day {new_expense.billing_day} of every month",
+            dedupe_key=f"subscription:{new_expense.subscription_id}",
         )
+    db.commit()
+    db.refresh(new_expense)
+    if new_expense.is_subscription:
+        outbox_worker.kick()
     return new_expense
 
 @router.get("/", response_model=List[ExpenseResponse])
-def read_expenses(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user_dep)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def read_expenses(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership:
         return []
 
-    expenses = db.query(Expense).filter(Expense.group_id == membership.group_id)\
+    # Open epoch only - settled expenses are listed per settlement
+    expenses = db.query(Expense).filter(Expense.group_id == membership.group_id, Expense.settlement_id.is_(None))\
                  .order_by(Expense.created_at.desc())\
                  .offset(skip).limit(limit).all()
     
@@ -63,97 +90,248 @@ def read_expenses(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
     # For now, simplistic return
     return expenses
 
+@router.get("/summary", response_model=ExpenseSummary)
+def get_expense_summary(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Totals per payer and per category, summed in SQL"""
+    if not membership:
+        return ExpenseSummary(total=0, count=0, by_payer=[], by_category=[])
+
+    total, count = func.sum(Expense.amount), func.count(Expense.id)
+    in_group = (Expense.group_id == membership.group_id) & Expense.settlement_id.is_(None)
+    by_payer = db.query(Expense.paid_by_id, User.full_name, total, count)\
+                 .outerjoin(User, User.id == Expense.paid_by_id)\
+                 .filter(in_group).group_by(Expense.paid_by_id, User.full_name).order_by(total.desc()).all()
+    by_category = db.query(Expense.category, total, count)\
+                    .filter(in_group).group_by(Expense.category).order_by(total.desc()).all()
+
+    return ExpenseSummary(
+        total=sum((row[2] for row in by_payer), Decimal("0.00")),
+        count=sum(row[3] for row in by_payer),
+        by_payer=[ExpenseTotal(key=uid, name=name or "Unknown", total=t, count=n) for uid, name, t, n in by_payer],
+        by_category=[ExpenseTotal(key=category, total=t, count=n) for category, t, n in by_category],
+    )
+
+@router.get("/subscriptions", response_model=List[SubscriptionResponse])
+def read_subscriptions(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Active recurring bills, by billing day"""
+    if not membership:
+        return []
+
+    return db.query(Subscription).filter(Subscription.group_id == membership.group_id, Subscription.active == True)\
+             .order_by(Subscription.billing_day).all()
+
+@router.delete("/subscriptions/{subscription_id}")
+def cancel_subscription(subscription_id: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Stop future charges; past charges stay"""
+    if not membership: raise HTTPException(status_code=400)
+
+    subscription = db.query(Subscription).filter(Subscription.id == subscription_id, Subscription.group_id == membership.group_id).first()
+    if not subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    subscription.active = False
+    db.commit()
+    return {"message": "Subscription cancelled"}
+
+@router.get("/analytics", response_model=ExpenseAnalytics)
+def get_expense_analytics(months: int = Query(12, ge=1, le=120), current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Spending over the last `months` calendar months (settled expenses included), read from the rollups"""
+    since = analytics.months_back(months)
+    zero = Decimal("0.00")
+    if not membership:
+        return ExpenseAnalytics(since=since, total=0, subscription=0, one_off=0, count=0, by_month=[], by_category=[], by_payer=[])
+
+    total, count = func.sum(ExpenseRollup.total), func.sum(ExpenseRollup.expense_count)
+    in_window = (ExpenseRollup.group_id == membership.group_id) & (ExpenseRollup.month >= since)
+    by_kind = db.query(ExpenseRollup.month, ExpenseRollup.is_subscription, total, count)\
+                .filter(in_window).group_by(ExpenseRollup.month, ExpenseRollup.is_subscription).all()
+    by_category = db.query(ExpenseRollup.category, total, count)\
+                    .filter(in_window).group_by(ExpenseRollup.category).order_by(total.desc()).all()
+    by_payer = db.query(ExpenseRollup.paid_by_id, User.full_name, total, count)\
+                 .outerjoin(User, User.id == ExpenseRollup.paid_by_id)\
+                 .filter(in_window).group_by(ExpenseRollup.paid_by_id, User.full_name).order_by(total.desc()).all()
+
+    by_month = {}
+    for month, is_subscription, t, n in by_kind:
+        bucket = by_month.setdefault(month, MonthTotal(month=month, total=zero, subscription=zero, one_off=zero, count=0))
+        bucket.total += t
+        bucket.count += n
+        if is_subscription:
+            bucket.subscription += t
+        else:
+            bucket.one_off += t
+    months_list = [by_month[m] for m in sorted(by_month)]
+
+    return ExpenseAnalytics(
+        since=since,
+        total=sum((m.total for m in months_list), zero),
+        subscription=sum((m.subscription for m in months_list), zero),
+        one_off=sum((m.one_off for m in months_list), zero),
+        count=sum(m.count for m in months_list),
+        by_month=months_list,
+        by_category=[ExpenseTotal(key=category, total=t, count=n) for category, t, n in by_category],
+        by_payer=[ExpenseTotal(key=uid, name=name or "Unknown", total=t, count=n) for uid, name, t, n in by_payer],
+    )
+
+def require_admin(membership: GroupContext, action: str):
+    if membership.role != "admin":
+        raise HTTPException(status_code=403, detail=f"Only the group admin can {action}")
+
+@router.post("/analytics/rebuild")
+def rebuild_expense_analytics(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Recompute the group's rollups from its expenses and archive (backfills, drift; group admin only)"""
+    if not membership: raise HTTPException(status_code=400)
+    require_admin(membership, "rebuild analytics")
+
+    buckets = analytics.rebuild(db, membership.group_id)
+    db.commit()
+    return {"buckets": buckets}
+
 @router.get("/balances")
-def get_balances(current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def get_balances(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: return {"total": 0, "debts": []}
     
-    group_id = membership.group_id
-    
-    # Get all members
-    raw_members = db.query(GroupMember).filter(GroupMember.group_id == group_id).all()
-    # Filter out orphaned members just in case
-    members = [m for m in raw_members if m.user is not None]
-    num_members = len(members)
-    if num_members == 0: return {"total": 0, "debts": []}
-    
-    # Get all expenses
-    expenses = db.query(Expense).filter(Expense.group_id == group_id).all()
-    
-    total_spent = sum(e.amount for e in expenses)
-    share_per_person = total_spent / num_members if num_members > 0 else 0
-    
-    # Calculate Paid per person
-    paid_by_user = {m.user_id: 0.0 for m in members}
-    user_names = {m.user_id: m.user.full_name for m in members}
-    
-    for e in expenses:
-        # If payer is no longer in group, we still validly count their payment, but we need to handle the Key
-        if e.paid_by_id not in paid_by_user:
-             paid_by_user[e.paid_by_id] = 0.0
-             # Fetch name if possible, or use Unknown
-             if e.paid_by_id not in user_names:
-                 user_names[e.paid_by_id] = "Ex-Member"
-        
-        paid_by_user[e.paid_by_id] += e.amount
-        
-    # Calculate Net
-    balances = {}
-    for uid, paid in paid_by_user.items():
-        # Only calculate share/debt for CURRENT members. 
-        # Ex-members who paid get credit (positive balance) but don't owe share (subtract 0? No, they don't owe share)
-        # Simplified logic: If they are in the group, they owe a share.
-        
-        is_member = any(m.user_id == uid for m in members)
-        owe_amount = share_per_person if is_member else 0
-        
-        balances[uid] = paid - owe_amount
-        
-    # Create Transfers (Greedy algorithm)
-    debtors = []
-    creditors = []
-    
-    for uid, bal in balances.items():
-        if bal < -0.01: debtors.append({'id': uid, 'amount': -bal})
-        elif bal > 0.01: creditors.append({'id': uid, 'amount': bal})
-        
-    debtors.sort(key=lambda x: x['amount'], reverse=True)
-    creditors.sort(key=lambda x: x['amount'], reverse=True)
-    
-    transfers = []
-    i = 0
-    j = 0
-    while i < len(debtors) and j < len(creditors):
-        debt = debtors[i]
-        credit = creditors[j]
-        
-        amount = min(debt['amount'], credit['amount'])
-        
-        if amount > 0:
-            transfers.append({
-                "from": user_names.get(debt['id'], "Unknown"),
-                "to": user_names.get(credit['id'], "Unknown"),
-                "amount": round(amount, 2)
-            })
-            
-        debtors[i]['amount'] -= amount
-        creditors[j]['amount'] -= amount
-        
-        if debtors[i]['amount'] < 0.01: i += 1
-        if creditors[j]['amount'] < 0.01: j += 1
-        
-    return {
-        "total": round(total_spent, 2),
-        "share_per_person": round(share_per_person, 2),
-        "transfers": transfers
-    }
+    return balances.compute_balances(db, membership.group_id)
 
 @router.post("/settle")
-def settle_expenses(current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def settle_expenses(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: raise HTTPException(status_code=400)
     
-    # Delete all expenses for group
-    db.query(Expense).filter(Expense.group_id == membership.group_id).delete()
+    # Close the open epoch; the expenses are kept (and archived in the background), not deleted
+    settlement = settle(db, membership.group_id, current_user.id)
     db.commit()
-    return {"message": "All settled up!"}
+    settlement_archiver.kick()
+    return {"message": "All settled up!", "settlement_id": settlement.id, "expense_count": settlement.expense_count}
+
+def settlement_response(settlement: Settlement) -> SettlementResponse:
+    return SettlementResponse(
+        id=settlement.id,
+        group_id=settlement.group_id,
+        settled_by_id=settlement.settled_by_id,
+        total=settlement.total,
+        expense_count=settlement.expense_count,
+        created_at=settlement.created_at,
+        snapshot=json.loads(settlement.snapshot) if settlement.snapshot else None,
+    )
+
+@router.get("/settlements", response_model=List[SettlementResponse])
+def read_settlements(skip: int = 0, limit: int = 20, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Past settle-ups, newest first"""
+    if not membership:
+        return []
+
+    settlements = db.query(Settlement).filter(Settlement.group_id == membership.group_id)\
+                    .order_by(Settlement.created_at.desc())\
+                    .offset(skip).limit(min(limit, 100)).all()
+    return [settlement_response(s) for s in settlements]
+
+@router.get("/settlements/{settlement_id}/expenses", response_model=List[ExpenseResponse])
+def read_settled_expenses(settlement_id: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """The expenses a settlement closed, whether or not the archiver has moved them yet"""
+    if not membership: raise HTTPException(status_code=400)
+
+    settlement = db.query(Settlement).filter(Settlement.id == settlement_id, Settlement.group_id == membership.group_id).first()
+    if not settlement:
+        raise HTTPException(status_code=404, detail="Settlement not found")
+
+    archived = db.query(ExpenseArchive).filter(ExpenseArchive.settlement_id == settlement.id).all()
+    pending = db.query(Expense).filter(Expense.settlement_id == settlement.id).all()
+    rows = [ExpenseResponse.model_validate(e, from_attributes=True) for e in archived + pending]
+    return sorted(rows, key=lambda e: e.created_at, reverse=True)
+
+@router.get("/balances/check")
+def check_balances(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Recompute the group's running totals from its expenses and report any drift (read-only)"""
+    if not membership: raise HTTPException(status_code=400)
+
+    drift = balances.check_consistency(db, membership.group_id)
+    return {"consistent": not drift, "drift": drift}
+
+@router.post("/balances/repair")
+def repair_balances(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """Rewrite the group's running totals from its expenses when they drifted (group admin only)"""
+    if not membership: raise HTTPException(status_code=400)
+    require_admin(membership, "repair balances")
+
+    drift = balances.check_consistency(db, membership.group_id, repair=True)
+    db.commit()
+    return {"consistent": not drift, "repaired": bool(drift), "drift": drift}
+
+from fastapi import UploadFile, File
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert
+from collections import defaultdict
+from app.core.database import SessionLocal
+from app.core.csvio import import_csv, row_error, stream_csv
+from app.models.user import GroupMember, generate_uuid
+from app.schemas.expense import ExpenseImportRow
+
+EXPENSE_CSV_COLUMNS = ["id", "date", "description", "amount", "category", "paid_by_email", "paid_by_name",
+                       "is_subscription", "billing_day", "settlement_id"]
+
+def expense_csv_rows(group_id: str):
+    # Own session: the request's session is closed before a streamed body is sent
+    with SessionLocal() as db:
+        for model in (ExpenseArchive, Expense):  # settled history first, then the open epoch
+            rows = db.query(model.id, model.created_at, model.description, model.amount, model.category,
+                            User.email, User.full_name, model.is_subscription, model.billing_day, model.settlement_id)\
+                     .outerjoin(User, User.id == model.paid_by_id)\
+                     .filter(model.group_id == group_id)\
+                     .order_by(model.created_at, model.id)\
+                     .yield_per(settings.CSV_EXPORT_BATCH_ROWS)
+            for row in rows:
+                yield [row[0], row[1].isoformat() if row[1] else None, *row[2:]]
+
+@router.get("/export")
+def export_expenses(current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """The group's full expense history (settled and open) as CSV, streamed"""
+    if not membership: raise HTTPException(status_code=400)
+
+    return StreamingResponse(
+        stream_csv(EXPENSE_CSV_COLUMNS, expense_csv_rows(membership.group_id)),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="expenses.csv"'},
+    )
+
+@router.post("/import")
+def import_expenses(file: UploadFile = File(...), current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """
+    Bulk-add expenses from a CSV (date, description, amount, category, paid_by_email).
+    Each chunk of rows is one bulk INSERT plus one balance/rollup upsert per payer/bucket,
+    committed together. Invalid rows are reported by line number and skipped.
+    """
+    if not membership: raise HTTPException(status_code=400)
+    group_id = membership.group_id
+    members = {email.lower(): user_id for user_id, email in
+               db.query(User.id, User.email).join(GroupMember, GroupMember.user_id == User.id).filter(GroupMember.group_id == group_id)}
+
+    def apply_chunk(chunk):
+        rows, errors = [], []
+        for line, values in chunk:
+            try:
+                item = ExpenseImportRow.model_validate(values)
+            except ValidationError as e:
+                errors.append(row_error(line, e))
+                continue
+            payer = members.get(item.paid_by_email.lower()) if item.paid_by_email else current_user.id
+            if payer is None:
+                errors.append(row_error(line, "Payer not in group"))
+                continue
+            rows.append({
+                "id": generate_uuid(), "description": item.description, "amount": item.amount,
+                "category": item.category, "is_subscription": False, "paid_by_id": payer,
+                "group_id": group_id, "created_at": item.date or datetime.utcnow(),
+            })
+        if rows:
+            db.execute(insert(Expense), rows)
+            paid = defaultdict(lambda: [Decimal("0.00"), 0])
+            for row in rows:
+                paid[row["paid_by_id"]][0] += row["amount"]
+                paid[row["paid_by_id"]][1] += 1
+            for payer, (amount, count) in paid.items():
+                balances.record_expense(db, group_id, payer, amount, count)
+            analytics.record_expenses(db, rows)
+            db.commit()
+        return len(rows), errors
+
+    return import_csv(file.file, apply_chunk)
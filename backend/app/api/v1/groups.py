@@ -1,36 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 from app.core.database import get_db
+from app.core.points import period_start
+from app.models.points import PointsRollup
 from app.models.user import Group, GroupMember, User
-from app.schemas.group import GroupCreate, GroupJoin, GroupResponse, GroupMemberResponse
+from app.schemas.group import GroupCreate, GroupJoin, GroupResponse, GroupMemberResponse, PointsPeriod
 
 import random
 import string
-from typing import List
+from typing import List, Literal, Optional
 
-# Fix for getting current user since I didn't export it in auth.py explicitly in the previous step
-# I'll just copy the dependency logic briefly or import it if I updated auth.py. 
-# Actually, I defined get_current_user in tasks.py too. I should centralize it.
-# For now, I'll import from tasks or re-declare. Re-declaring for speed avoiding circular import hell.
-
-from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-from app.core.config import settings
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
-
-def get_current_user_dep(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401)
-    except JWTError:
-        raise HTTPException(status_code=401)
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=401)
-    return user
+from app.core.deps import get_current_user, invalidate_memberships, is_member
 
 router = APIRouter()
 
@@ -38,7 +19,7 @@ def generate_invite_code():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
 @router.post("/", response_model=GroupResponse)
-def create_group(group: GroupCreate, current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
+def create_group(group: GroupCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Check if user already has a group? Optional. Let's allow multiple for now but frontend might restrict.
     
     code = generate_invite_code()
@@ -53,11 +34,12 @@ def create_group(group: GroupCreate, current_user: User = Depends(get_current_us
     member = GroupMember(group_id=new_group.id, user_id=current_user.id, role="admin")
     db.add(member)
     db.commit()
+    invalidate_memberships(current_user.id)
     
     return new_group
 
 @router.post("/join", response_model=GroupResponse)
-def join_group(join_data: GroupJoin, current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
+def join_group(join_data: GroupJoin, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     group = db.query(Group).filter(Group.invite_code == join_data.invite_code).first()
     if not group:
         raise HTTPException(status_code=404, detail="Invalid invite code")
@@ -70,21 +52,21 @@ def join_group(join_data: GroupJoin, current_user: User = Depends(get_current_us
     new_member = GroupMember(group_id=group.id, user_id=current_user.id, role="member")
     db.add(new_member)
     db.commit()
+    invalidate_memberships(current_user.id)
     
     return group
 
 @router.get("/my", response_model=List[GroupResponse])
-def get_my_groups(current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
+def get_my_groups(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Join queries often better, but lazy loading works too
     memberships = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).all()
     groups = [m.group for m in memberships]
     return groups
 
 @router.get("/{group_id}/members", response_model=List[GroupMemberResponse])
-def get_group_members(group_id: str, current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
+def get_group_members(group_id: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Check access
-    exists = db.query(GroupMember).filter(GroupMember.group_id == group_id, GroupMember.user_id == current_user.id).first()
-    if not exists:
+    if not is_member(current_user.id, group_id, db):
         raise HTTPException(status_code=403, detail="Not a member")
         
     members = db.query(GroupMember).filter(GroupMember.group_id == group_id).all()
@@ -100,20 +82,60 @@ def get_group_members(group_id: str, current_user: User = Depends(get_current_us
     ]
 
 @router.get("/{group_id}/leaderboard", response_model=List[GroupMemberResponse])
-def get_group_leaderboard(group_id: str, current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
+def get_group_leaderboard(
+    group_id: str,
+    period: Literal["all", "week", "month"] = "all",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Members by points: lifetime balance, or points earned this week / month (from the rollups)"""
     # Check access
-    exists = db.query(GroupMember).filter(GroupMember.group_id == group_id, GroupMember.user_id == current_user.id).first()
-    if not exists:
+    if not is_member(current_user.id, group_id, db):
         raise HTTPException(status_code=403, detail="Not a member")
-        
-    members = db.query(GroupMember).filter(GroupMember.group_id == group_id).join(User).order_by(User.current_points.desc()).all()
-    
+
+    if period == "all":
+        members = db.query(GroupMember).filter(GroupMember.group_id == group_id).join(User).order_by(User.current_points.desc()).all()
+        return [
+            GroupMemberResponse(
+                user_id=m.user.id,
+                full_name=m.user.full_name,
+                avatar_url=m.user.avatar_url,
+                role=m.role,
+                points=m.user.current_points
+            ) for m in members if m.user is not None
+        ]
+
+    earned = func.coalesce(PointsRollup.earned, 0)
+    rows = db.query(GroupMember.role, User.id, User.full_name, User.avatar_url, earned)\
+             .join(User, User.id == GroupMember.user_id)\
+             .outerjoin(PointsRollup, and_(
+                 PointsRollup.user_id == GroupMember.user_id,
+                 PointsRollup.group_id == group_id,
+                 PointsRollup.period == period,
+                 PointsRollup.period_start == period_start(period),
+             ))\
+             .filter(GroupMember.group_id == group_id)\
+             .order_by(earned.desc()).all()
     return [
-        GroupMemberResponse(
-            user_id=m.user.id,
-            full_name=m.user.full_name,
-            avatar_url=m.user.avatar_url,
-            role=m.role,
-            points=m.user.current_points
-        ) for m in members if m.user is not None
+        GroupMemberResponse(user_id=user_id, full_name=full_name, avatar_url=avatar_url, role=role, points=points)
+        for role, user_id, full_name, avatar_url, points in rows
     ]
+
+@router.get("/{group_id}/points", response_model=List[PointsPeriod])
+def get_points_history(
+    group_id: str,
+    period: Literal["week", "month"] = "week",
+    limit: int = Query(12, ge=1, le=104),
+    user_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Points earned / spent per week or month for one member (default: you), most recent first"""
+    if not is_member(current_user.id, group_id, db):
+        raise HTTPException(status_code=403, detail="Not a member")
+
+    return db.query(PointsRollup).filter(
+        PointsRollup.user_id == (user_id or current_user.id),
+        PointsRollup.group_id == group_id,
+        PointsRollup.period == period,
+    ).order_by(PointsRollup.period_start.desc()).limit(limit).all()
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from typing import Literal
+import os
+
+from app.core.images import MEDIA_KINDS, STATIC_DIR, image_pipeline, variant_path
+
+router = APIRouter()
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+@router.get("/{kind}/{filename}")
+async def get_media(kind: str, filename: str, size: Literal["original", "thumb", "medium"] = "original"):
+    """
+    An uploaded image, or one of its resized WebP variants (?size=thumb|medium).
+    Until a variant has been rendered the original is served (briefly cacheable) and rendering is queued,
+    unless the image's last render failed recently (the pipeline backs off before trying it again).
+    """
+    if kind not in MEDIA_KINDS or filename.startswith(".") or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(STATIC_DIR, kind, filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    if size != "original":
+        derived = variant_path(path, size)
+        if os.path.isfile(derived):
+            return FileResponse(derived, media_type="image/webp", headers={"Cache-Control": IMMUTABLE})
+        image_pipeline.submit(path)
+        return FileResponse(path, headers={"Cache-Control": "public, max-age=60"})
+    return FileResponse(path, headers={"Cache-Control": IMMUTABLE})
@@ -6,8 +6,8 @@ from pydantic import BaseModel
 
 from app.core.database import get_db
 from app.models.pantry import PantryItem, ShoppingItem
-from app.models.user import User, GroupMember
-from app.api.v1.tasks import get_current_user
+from app.models.user import User
+from app.core.deps import get_current_user, get_group_context, GroupContext
 
 router = APIRouter()
 
@@ -29,14 +29,12 @@ class ShoppingItemCreate(ShoppingItemBase):
 
 # Endpoints
 @router.get("/items", response_model=List[dict])
-def get_pantry(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def get_pantry(db: Session = Depends(get_db), current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: return []
     return db.query(PantryItem).filter(PantryItem.group_id == membership.group_id).all()
 
 @router.post("/items")
-def add_pantry_item(item: PantryItemCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def add_pantry_item(item: PantryItemCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: raise HTTPException(status_code=400, detail="No group")
     
     new_item = PantryItem(**item.dict(), group_id=membership.group_id)
@@ -55,14 +53,12 @@ def delete_pantry_item(item_id: str, db: Session = Depends(get_db), current_user
 
 # Shopping List
 @router.get("/shopping-list", response_model=List[dict])
-def get_shopping_list(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def get_shopping_list(db: Session = Depends(get_db), current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: return []
     return db.query(ShoppingItem).filter(ShoppingItem.group_id == membership.group_id).all()
 
 @router.post("/shopping-list")
-def add_shopping_item(item: ShoppingItemCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def add_shopping_item(item: ShoppingItemCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: raise HTTPException(status_code=400, detail="No group")
     
     new_item = ShoppingItem(name=item.name, group_id=membership.group_id, added_by_id=current_user.id)
@@ -1,17 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.core.database import get_db
 from app.models.reward import Reward, Redemption
-from app.models.user import User, GroupMember
+from app.models.user import User, generate_uuid
+from app.core import points
 from app.schemas.reward import RewardCreate, RewardResponse, RedemptionResponse
-from app.api.v1.groups import get_current_user_dep
+from app.core.deps import get_current_user, get_group_context, GroupContext
 
 router = APIRouter()
 
 @router.post("/", response_model=RewardResponse)
-def create_reward(reward: RewardCreate, current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def create_reward(reward: RewardCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership:
         raise HTTPException(status_code=400, detail="User not in group")
 
@@ -27,8 +28,7 @@ def create_reward(reward: RewardCreate, current_user: User = Depends(get_current
     return new_reward
 
 @router.get("/", response_model=List[RewardResponse])
-def get_rewards(current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def get_rewards(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership:
         return []
 
@@ -36,19 +36,19 @@ def get_rewards(current_user: User = Depends(get_current_user_dep), db: Session
     return rewards
 
 @router.post("/{reward_id}/claim", response_model=RedemptionResponse)
-def claim_reward(reward_id: str, current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
+def claim_reward(reward_id: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     reward = db.query(Reward).filter(Reward.id == reward_id).first()
     if not reward:
         raise HTTPException(status_code=404, detail="Reward not found")
         
-    if current_user.current_points < reward.cost:
+    # Deduct points (balance check and decrement are one UPDATE)
+    redemption_id = generate_uuid()
+    if not points.spend(db, current_user.id, reward.group_id, reward.cost, "reward_claimed", redemption_id):
         raise HTTPException(status_code=400, detail="Not enough points")
-        
-    # Deduct points
-    current_user.current_points -= reward.cost
     
     # Create redemption record
     redemption = Redemption(
+        id=redemption_id,
         user_id=current_user.id,
         reward_id=reward.id,
         group_id=reward.group_id,
@@ -56,7 +56,6 @@ def claim_reward(reward_id: str, current_user: User = Depends(get_current_user_d
     )
     
     db.add(redemption)
-    db.add(current_user)
     db.commit()
     db.refresh(redemption)
     return redemption
@@ -64,8 +63,7 @@ def claim_reward(reward_id: str, current_user: User = Depends(get_current_user_d
 from app.schemas.reward import RedemptionRead
 
 @router.get("/redemptions/pending", response_model=List[RedemptionRead])
-def get_pending_redemptions(current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def get_pending_redemptions(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: return []
     
     redemptions = db.query(Redemption).filter(Redemption.group_id == membership.group_id, Redemption.status == "pending").all()
@@ -81,8 +79,7 @@ def get_pending_redemptions(current_user: User = Depends(get_current_user_dep),
     return results
 
 @router.put("/redemptions/{redemption_id}", response_model=RedemptionResponse)
-def update_redemption_status(redemption_id: str, status: str, current_user: User = Depends(get_current_user_dep), db: Session = Depends(get_db)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def update_redemption_status(redemption_id: str, status: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership: raise HTTPException(status_code=403, detail="Not authorized")
     
     redemption = db.query(Redemption).filter(Redemption.id == redemption_id).first()
@@ -95,14 +92,16 @@ def update_redemption_status(redemption_id: str, status: str, current_user: User
         raise HTTPException(status_code=400, detail="Invalid status")
 
     if status == "rejected" and redemption.status != "rejected":
-        # Refund points
-        user = db.query(User).filter(User.id == redemption.user_id).first()
-        # Need cost. access via relationship or query.
+        # Refund points, once: only the request that flips the status refunds
+        flipped = db.execute(
+            update(Redemption)
+            .where(Redemption.id == redemption.id, Redemption.status != "rejected")
+            .values(status="rejected")
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
         cost = redemption.reward.cost if redemption.reward else 0
-        
-        if user and cost > 0:
-            user.current_points += cost
-            db.add(user)
+        if flipped and cost > 0:
+            points.award(db, redemption.user_id, redemption.group_id, cost, "reward_refunded", redemption.id)
             
     redemption.status = status
     db.commit()
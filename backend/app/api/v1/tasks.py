@@ -1,39 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, delete, func, insert, or_, update
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from collections import defaultdict
 from app.core.database import get_db
-from app.models.task import Task, TaskStatus
-from app.models.user import User, GroupMember
-from app.schemas.task import TaskCreate, TaskResponse, TaskUpdate
-from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
+from app.models.task import Task, TaskPriority, TaskSeries, TaskStatus
+from app.models.user import GroupMember, User, generate_uuid
+from app.schemas.task import TaskBatch, TaskCreate, TaskOperationResult, TaskResponse, TaskUpdate
+from app.core.deps import get_current_user, get_group_context, GroupContext
+from app.core import points
+from app.core.recurrence import create_series, materialize, parse_rule
 from app.core.config import settings
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise credentials_exception
-    return user
-
 @router.post("/", response_model=TaskResponse)
-def create_task(task: TaskCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def create_task(task: TaskCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership:
         raise HTTPException(status_code=400, detail="User not part of any group")
 
@@ -49,19 +32,101 @@ def create_task(task: TaskCreate, current_user: User = Depends(get_current_user)
         group_id=membership.group_id
     )
     db.add(new_task)
+    if task.recurrence:
+        try:
+            series = create_series(db, new_task, task.recurrence)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Fill the agenda now instead of waiting for the next sweep
+        materialize(db, [series], recurrence_horizon(series))
     db.commit()
     db.refresh(new_task)
     return new_task
 
+def filter_tasks(query, group_id: str, status, assigned_to_id, priority, due_after, due_before, needs_approval):
+    query = query.filter(Task.group_id == group_id)
+    if status:
+        query = query.filter(Task.status.in_([s.value for s in status]))
+    if assigned_to_id:
+        query = query.filter(Task.assigned_to_id == assigned_to_id)
+    if priority:
+        query = query.filter(Task.priority == priority.value)
+    if due_after:
+        query = query.filter(Task.due_date >= due_after)
+    if due_before:
+        query = query.filter(Task.due_date < due_before)
+    if needs_approval:
+        query = query.filter(Task.needs_approval == needs_approval)
+    return query
+
 @router.get("/", response_model=List[TaskResponse])
-def read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def read_tasks(
+    response: Response,
+    before: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    status: Optional[List[TaskStatus]] = Query(None),
+    assigned_to_id: Optional[str] = None,
+    priority: Optional[TaskPriority] = None,
+    due_after: Optional[datetime] = None,
+    due_before: Optional[datetime] = None,
+    needs_approval: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    membership: Optional[GroupContext] = Depends(get_group_context)
+):
+    """
+    One page of the group's tasks, newest first, filtered server-side.
+    `before` is the id of the last task of the previous page; when more pages exist
+    the next cursor is returned in the X-Next-Cursor header.
+    """
     if not membership:
         return []
-        
-    return db.query(Task).filter(Task.group_id == membership.group_id).offset(skip).limit(limit).all()
 
-from datetime import timedelta, datetime
+    query = filter_tasks(db.query(Task), membership.group_id, status, assigned_to_id, priority,
+                         due_after, due_before, needs_approval)
+
+    if before:
+        ref = db.query(Task.created_at, Task.id).filter(Task.id == before, Task.group_id == membership.group_id).first()
+        if not ref:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(or_(
+            Task.created_at < ref.created_at,
+            and_(Task.created_at == ref.created_at, Task.id < ref.id)
+        ))
+
+    tasks = query.order_by(Task.created_at.desc(), Task.id.desc()).limit(limit + 1).all()
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        response.headers["X-Next-Cursor"] = tasks[-1].id
+    return tasks
+
+@router.get("/count")
+def count_tasks(
+    status: Optional[List[TaskStatus]] = Query(None),
+    assigned_to_id: Optional[str] = None,
+    priority: Optional[TaskPriority] = None,
+    due_after: Optional[datetime] = None,
+    due_before: Optional[datetime] = None,
+    needs_approval: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    membership: Optional[GroupContext] = Depends(get_group_context)
+):
+    """How many of the group's tasks match the same filters as GET /tasks/, counted in SQL."""
+    if not membership:
+        return {"count": 0}
+    query = filter_tasks(db.query(func.count(Task.id)), membership.group_id, status, assigned_to_id, priority,
+                         due_after, due_before, needs_approval)
+    return {"count": query.scalar()}
+
+def claim_transition(db: Session, *criteria, **values) -> bool:
+    """UPDATE tasks SET values WHERE criteria; True if this call made the change."""
+    result = db.execute(update(Task).where(*criteria).values(**values).execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+def recurrence_horizon(series: TaskSeries) -> datetime:
+    # At least the next occurrence, so a completed chore always has a follow-up on the board
+    return max(datetime.utcnow() + timedelta(days=settings.RECURRENCE_HORIZON_DAYS), series.next_due_at)
 
 @router.put("/{task_id}", response_model=TaskResponse)
 def update_task_status(task_id: str, status: TaskStatus, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -69,41 +134,128 @@ def update_task_status(task_id: str, status: TaskStatus, db: Session = Depends(g
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    # Logic: If moving TO completed FROM non-completed, award points
-    if status == TaskStatus.completed and task.status != TaskStatus.completed:
-        current_user.current_points += task.points
-        db.add(current_user)
-        
-        # Handle Recurrence
-        if task.recurrence:
-            delta = None
-            if task.recurrence == 'daily': delta = timedelta(days=1)
-            elif task.recurrence == 'weekly': delta = timedelta(weeks=1)
-            elif task.recurrence == 'monthly': delta = timedelta(days=30)
-            
-            if delta:
-                base_date = task.due_date if task.due_date else datetime.utcnow()
-                next_date = base_date + delta
-                
-                next_task = Task(
-                    title=task.title,
-                    description=task.description,
-                    priority=task.priority,
-                    points=task.points,
-                    due_date=next_date,
-                    recurrence=task.recurrence,
-                    assigned_to_id=task.assigned_to_id,
-                    created_by_id=task.created_by_id,
-                    group_id=task.group_id,
-                    status=TaskStatus.pending
-                )
-                db.add(next_task)
+    # Logic: If moving TO completed FROM non-completed, award points.
+    # The status flip is a conditional UPDATE so two concurrent completions award once.
+    if status == TaskStatus.completed and task.status != TaskStatus.completed and claim_transition(
+        db, Task.id == task.id, Task.status != TaskStatus.completed.value, status=TaskStatus.completed.value
+    ):
+        points.award(db, current_user.id, task.group_id, task.points, "task_completed", task.id)
+
+        # Legacy recurring task (no series yet): upgrade it so the sweep takes over
+        if task.recurrence and not task.series_id:
+            try:
+                series = create_series(db, task, task.recurrence)
+                materialize(db, [series], recurrence_horizon(series))
+            except ValueError:
+                pass
 
     task.status = status
     db.commit()
     db.refresh(task)
     return task
 
+@router.post("/batch", response_model=List[TaskOperationResult])
+def batch_tasks(batch: TaskBatch, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """
+    Apply many create / status / assign / delete operations in one transaction.
+    All items are validated against one task lookup and one member lookup, then applied
+    with one statement per kind of change. Invalid items are reported and skipped.
+    """
+    if not membership:
+        raise HTTPException(status_code=400, detail="User not part of any group")
+    group_id = membership.group_id
+    ops = batch.operations
+    results = [TaskOperationResult(index=i, op=o.op, ok=False, task_id=o.task_id) for i, o in enumerate(ops)]
+
+    task_ids = {o.task_id for o in ops if o.op != "create" and o.task_id}
+    existing = set()
+    if task_ids:
+        existing = {task_id for (task_id,) in db.query(Task.id).filter(Task.group_id == group_id, Task.id.in_(task_ids))}
+    assignees = {o.assigned_to_id for o in ops if o.op == "assign" and o.assigned_to_id}
+    assignees |= {o.task.assigned_to_id for o in ops if o.op == "create" and o.task and o.task.assigned_to_id}
+    members = set()
+    if assignees:
+        members = {user_id for (user_id,) in db.query(GroupMember.user_id).filter(GroupMember.group_id == group_id, GroupMember.user_id.in_(assignees))}
+
+    creates, by_status, by_assignee, deletes = [], defaultdict(list), defaultdict(list), []
+    seen = set()
+    for o, result in zip(ops, results):
+        if o.op == "create":
+            if o.task is None:
+                result.error = "Missing task"
+            elif o.task.assigned_to_id and o.task.assigned_to_id not in members:
+                result.error = "Assignee not in group"
+            else:
+                try:
+                    if o.task.recurrence:
+                        parse_rule(o.task.recurrence, o.task.due_date or datetime.utcnow())
+                    result.task_id = generate_uuid()
+                    creates.append((result.task_id, o.task))
+                    result.ok = True
+                except ValueError as e:
+                    result.error = str(e)
+            continue
+
+        if o.task_id not in existing:
+            result.error = "Task not found"
+        elif o.task_id in seen:
+            result.error = "Duplicate operation for task"
+        elif o.op == "status" and o.status is None:
+            result.error = "Missing status"
+        elif o.op == "assign" and o.assigned_to_id and o.assigned_to_id not in members:
+            result.error = "Assignee not in group"
+        else:
+            seen.add(o.task_id)
+            if o.op == "status":
+                by_status[o.status].append(o.task_id)
+            elif o.op == "assign":
+                by_assignee[o.assigned_to_id].append(o.task_id)
+            else:
+                deletes.append(o.task_id)
+            result.ok = True
+
+    rows = []
+    for task_id, task in creates:
+        if task.recurrence:
+            new_task = Task(id=task_id, created_by_id=current_user.id, group_id=group_id, **task.model_dump())
+            db.add(new_task)
+            series = create_series(db, new_task, task.recurrence)
+            materialize(db, [series], recurrence_horizon(series))
+        else:
+            rows.append(dict(task.model_dump(), id=task_id, created_by_id=current_user.id, group_id=group_id,
+                             status=TaskStatus.pending.value, needs_approval="no", created_at=datetime.utcnow()))
+    if rows:
+        db.execute(insert(Task), rows)
+
+    for status, ids in by_status.items():
+        if status != TaskStatus.completed:
+            db.execute(update(Task).where(Task.id.in_(ids)).values(status=status.value).execution_options(synchronize_session=False))
+            continue
+        # Only tasks this statement actually completes earn points (same rule as PUT /tasks/{id})
+        completed = db.execute(
+            update(Task).where(Task.id.in_(ids), Task.status != TaskStatus.completed.value)
+            .values(status=TaskStatus.completed.value)
+            .returning(Task.id, Task.points, Task.recurrence, Task.series_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        points.award_many(db, current_user.id, group_id, [(row.points, row.id) for row in completed], "task_completed")
+        for row in completed:
+            if row.recurrence and not row.series_id:
+                try:
+                    series = create_series(db, db.get(Task, row.id), row.recurrence)
+                    materialize(db, [series], recurrence_horizon(series))
+                except ValueError:
+                    pass
+
+    for assignee, ids in by_assignee.items():
+        db.execute(update(Task).where(Task.id.in_(ids)).values(assigned_to_id=assignee).execution_options(synchronize_session=False))
+
+    if deletes:
+        db.execute(delete(Task).where(Task.id.in_(deletes)).execution_options(synchronize_session=False))
+
+    db.commit()
+    return results
+
 @router.delete("/{task_id}")
 def delete_task(task_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     task = db.query(Task).filter(Task.id == task_id).first()
@@ -114,9 +266,26 @@ def delete_task(task_id: str, db: Session = Depends(get_db), current_user: User
     db.commit()
     return {"message": "Task deleted successfully"}
 
+@router.delete("/{task_id}/series")
+def stop_series(task_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Stop a task's recurrence and drop its future occurrences that haven't been started."""
+    task = db.query(Task).filter(Task.id == task_id).first()
+    if not task or not task.series_id:
+        raise HTTPException(status_code=404, detail="Recurring task not found")
+
+    db.query(TaskSeries).filter(TaskSeries.id == task.series_id).update({"active": False, "next_due_at": None})
+    removed = db.query(Task).filter(
+        Task.series_id == task.series_id,
+        Task.status == TaskStatus.pending.value,
+        Task.due_date > datetime.utcnow(),
+    ).delete(synchronize_session=False)
+    db.commit()
+    return {"message": "Recurrence stopped", "removed": removed}
+
 from fastapi import UploadFile, File
-import shutil
-import os
+from fastapi.concurrency import run_in_threadpool
+from app.core.uploads import store_image
+from app.core.images import image_pipeline
 
 @router.post("/{task_id}/proof")
 async def upload_task_proof(
@@ -125,33 +294,25 @@ async def upload_task_proof(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    task = db.query(Task).filter(Task.id == task_id).first()
+    task = await run_in_threadpool(lambda: db.query(Task).filter(Task.id == task_id).first())
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    
-    # Validate extension
-    ext = file.filename.split(".")[-1].lower()
-    if ext not in ["jpg", "jpeg", "png", "gif", "webp"]:
-        raise HTTPException(status_code=400, detail="Invalid image format")
-    
-    # Create proof directory
-    os.makedirs("app/static/proofs", exist_ok=True)
-    
-    filename = f"{task_id}_{current_user.id}.{ext}"
-    file_path = f"app/static/proofs/{filename}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
+
+    # Streamed to disk off the event loop, named by content hash
+    stored = await store_image(file, "app/static/proofs")
+
     base_url = "http://localhost:8000"
-    task.proof_photo_url = f"{base_url}/static/proofs/{filename}"
+    task.proof_photo_url = f"{base_url}/api/v1/media/proofs/{stored.filename}"  # ?size=thumb|medium for variants
+    image_pipeline.submit(stored.path)
     task.needs_approval = "pending"
     task.status = TaskStatus.completed  # Mark as completed but pending approval
-    
-    db.add(task)
-    db.commit()
-    db.refresh(task)
-    
+
+    def save():
+        db.add(task)
+        db.commit()
+        db.refresh(task)
+    await run_in_threadpool(save)
+
     return {"message": "Proof uploaded, awaiting approval", "proof_url": task.proof_photo_url}
 
 @router.put("/{task_id}/approve")
@@ -169,14 +330,10 @@ def approve_task_proof(
         raise HTTPException(status_code=400, detail="Task not pending approval")
     
     if approved:
-        task.needs_approval = "approved"
-        task.approved_by_id = current_user.id
-        # Award points
-        if task.assigned_to_id:
-            assignee = db.query(User).filter(User.id == task.assigned_to_id).first()
-            if assignee:
-                assignee.current_points += task.points
-                db.add(assignee)
+        # Award points (only the request that flips pending -> approved does)
+        if claim_transition(db, Task.id == task.id, Task.needs_approval == "pending",
+                            needs_approval="approved", approved_by_id=current_user.id) and task.assigned_to_id:
+            points.award(db, task.assigned_to_id, task.group_id, task.points, "task_approved", task.id)
     else:
         task.needs_approval = "rejected"
         task.status = TaskStatus.pending  # Reset to pending
@@ -188,8 +345,7 @@ def approve_task_proof(
     return {"message": f"Task {'approved' if approved else 'rejected'}", "task": task}
 
 @router.get("/pending-approvals", response_model=List[TaskResponse])
-def get_pending_approvals(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    membership = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).first()
+def get_pending_approvals(db: Session = Depends(get_db), current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
     if not membership:
         return []
     
@@ -197,3 +353,84 @@ def get_pending_approvals(db: Session = Depends(get_db), current_user: User = De
         Task.group_id == membership.group_id,
         Task.needs_approval == "pending"
     ).all()
+
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.orm import aliased
+from app.core.database import SessionLocal
+from app.core.csvio import import_csv, row_error, stream_csv
+from app.schemas.task import TaskImportRow
+
+TASK_CSV_COLUMNS = ["id", "title", "description", "status", "priority", "points", "due_date", "recurrence",
+                    "assigned_to_email", "created_by_email", "created_at", "needs_approval"]
+
+def task_csv_rows(group_id: str):
+    # Own session: the request's session is closed before a streamed body is sent
+    Assignee, Creator = aliased(User), aliased(User)
+    with SessionLocal() as db:
+        rows = db.query(Task.id, Task.title, Task.description, Task.status, Task.priority, Task.points, Task.due_date,
+                        Task.recurrence, Assignee.email, Creator.email, Task.created_at, Task.needs_approval)\
+                 .outerjoin(Assignee, Assignee.id == Task.assigned_to_id)\
+                 .outerjoin(Creator, Creator.id == Task.created_by_id)\
+                 .filter(Task.group_id == group_id)\
+                 .order_by(Task.created_at, Task.id)\
+                 .yield_per(settings.CSV_EXPORT_BATCH_ROWS)
+        for row in rows:
+            yield [value.isoformat() if isinstance(value, datetime) else value for value in row]
+
+@router.get("/export")
+def export_tasks(current_user: User = Depends(get_current_user), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """All of the group's tasks as CSV, streamed"""
+    if not membership:
+        raise HTTPException(status_code=400, detail="User not part of any group")
+
+    return StreamingResponse(
+        stream_csv(TASK_CSV_COLUMNS, task_csv_rows(membership.group_id)),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="tasks.csv"'},
+    )
+
+@router.post("/import")
+def import_tasks(file: UploadFile = File(...), current_user: User = Depends(get_current_user), db: Session = Depends(get_db), membership: Optional[GroupContext] = Depends(get_group_context)):
+    """
+    Bulk-create tasks from a CSV (title, description, status, priority, points, due_date,
+    recurrence, assigned_to_email), one bulk INSERT and commit per chunk of rows.
+    Imported completed tasks don't award points. Invalid rows are reported and skipped.
+    """
+    if not membership:
+        raise HTTPException(status_code=400, detail="User not part of any group")
+    group_id = membership.group_id
+    members = {email.lower(): user_id for user_id, email in
+               db.query(User.id, User.email).join(GroupMember, GroupMember.user_id == User.id).filter(GroupMember.group_id == group_id)}
+
+    def apply_chunk(chunk):
+        rows, recurring, errors = [], [], []
+        for line, values in chunk:
+            try:
+                item = TaskImportRow.model_validate(values)
+                if item.recurrence:
+                    parse_rule(item.recurrence, item.due_date or datetime.utcnow())
+            except (ValidationError, ValueError) as e:
+                errors.append(row_error(line, e))
+                continue
+            assignee = members.get(item.assigned_to_email.lower()) if item.assigned_to_email else None
+            if item.assigned_to_email and assignee is None:
+                errors.append(row_error(line, "Assignee not in group"))
+                continue
+            task = dict(item.model_dump(exclude={"status", "assigned_to_email"}), id=generate_uuid(),
+                        assigned_to_id=assignee, created_by_id=current_user.id, group_id=group_id)
+            if item.recurrence:
+                recurring.append(Task(status=item.status.value, **task))
+            else:
+                rows.append(dict(task, status=item.status.value, needs_approval="no", created_at=datetime.utcnow()))
+        if rows:
+            db.execute(insert(Task), rows)
+        # Recurring ones need their series (same path as POST /tasks)
+        for new_task in recurring:
+            db.add(new_task)
+            series = create_series(db, new_task, new_task.recurrence)
+            materialize(db, [series], recurrence_horizon(series))
+        db.commit()
+        return len(rows) + len(recurring), errors
+
+    return import_csv(file.file, apply_chunk)
@@ -1,7 +1,13 @@
 import google.generativeai as genai
+import asyncio
 import os
 import json
+import re
+import time
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.intents import parse_intent, strip_homie
 
 # Configure Gemini
 # In production, use os.getenv("GEMINI_API_KEY")
@@ -42,48 +48,419 @@ tools_schema = [
     }
 ]
 
-async def get_homie_response(message: str, history: list = []):
-    if not os.getenv("GEMINI_API_KEY"):
-        return {
-            "text": "I need a GEMINI_API_KEY to think! (Check .env)",
-            "tool_calls": []
-        }
+TOOL_MARKER = "TOOL:"
+NO_KEY_REPLY = {
+    "text": "I need a GEMINI_API_KEY to think! (Check .env)",
+    "tool_calls": []
+}
 
-    try:
-        model = genai.GenerativeModel('gemini-pro')
-        # Simple prompt construction as chat session management is complex in stateless
-        # For now, just one-shot with context or minimal history
-        
-        prompt = f"""
-        You are Homie, a fun, helpful AI house manager for a shared home.
-        You speak in a cool, friendly, slightly cartoonsy way.
-        
-        User says: {message}
-        
-        If the user wants to create a task or expense, output JSON with "tool" and "args".
-        Otherwise, just reply with "text".
-        
-        Example Task: {{"tool": "create_task", "args": {{"title": "Buy Milk", "priority": "medium"}}}}
-        Example text: {{"text": "Sure thing! I'll remind you."}}
-        
-        Only output JSON.
-        """
-        
-        response = model.generate_content(prompt)
-        text = response.text
-        
-        # Parse JSON
+# Plain-text replies (so they can be streamed), with actions as trailing TOOL: lines
+PROMPT_TEMPLATE = """
+You are Homie, a fun, helpful AI house manager for a shared home.
+You speak in a cool, friendly, slightly cartoonsy way.
+
+{context}User says: {message}
+
+Reply to the user in plain text.
+If the user wants to create a task or expense, end your reply with one line per action:
+TOOL: {{"tool": "create_task", "args": {{"title": "Buy Milk", "priority": "medium"}}}}
+TOOL: {{"tool": "create_expense", "args": {{"description": "Pizza", "amount": 20, "category": "Food"}}}}
+"""
+
+def build_prompt(message: str, history: list = [], excerpt: str = "") -> str:
+    """`history` is the recent chat as "Name: text" lines, `excerpt` shortened lines of older turns."""
+    context = ""
+    if excerpt:
+        context += f"Earlier in the chat (shortened):\n{excerpt}\n\n"
+    if history:
+        context += "Recent chat:\n" + "\n".join(history) + "\n\n"
+    return PROMPT_TEMPLATE.format(context=context, message=message)
+
+def parse_homie_output(text: str) -> dict:
+    """Split a completion into the reply text and tool calls."""
+    clean_text = text.replace("```json", "").replace("```", "").strip()
+
+    # Older single-JSON format: {"tool": ..., "args": ...} or {"text": ...}
+    if clean_text.startswith("{"):
         try:
-            # clean code fences if any
-            clean_text = text.replace("```json", "").replace("```", "").strip()
             data = json.loads(clean_text)
-            
             if "tool" in data:
                 return {"text": f"On it! Creating {data.get('tool')}...", "tool_calls": [data]}
             return {"text": data.get("text", text), "tool_calls": []}
-            
-        except:
-             return {"text": text, "tool_calls": []}
+        except (ValueError, AttributeError):
+            pass
+
+    marker = clean_text.find(TOOL_MARKER)
+    if marker < 0:
+        return {"text": clean_text, "tool_calls": []}
+
+    tool_calls = []
+    for line in clean_text[marker:].splitlines():
+        line = line.strip()
+        if line.startswith(TOOL_MARKER):
+            try:
+                tool_calls.append(json.loads(line[len(TOOL_MARKER):]))
+            except ValueError:
+                pass
+    reply = clean_text[:marker].strip()
+    if not reply and tool_calls:
+        reply = f"On it! Creating {tool_calls[0].get('tool')}..."
+    return {"text": reply, "tool_calls": tool_calls}
+
+async def iterate_in_thread(make_iter: Callable[[], Iterator[str]]) -> AsyncIterator[str]:
+    """Drive a blocking iterator (the SDK's streaming response) in a thread, yielding items on the loop."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = False
+
+    def pump():
+        try:
+            for item in make_iter():
+                if stop:
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    loop.run_in_executor(None, pump)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop = True  # consumer went away: let the thread finish early
+
+class GeminiProvider:
+    def __init__(self, model_name: str = "gemini-pro"):
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        # The SDK call is blocking; keep it off the event loop
+        response = await asyncio.to_thread(self.model.generate_content, prompt)
+        return response.text
+
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        return iterate_in_thread(lambda: (chunk.text for chunk in self.model.generate_content(prompt, stream=True)))
+
+class FakeProvider:
+    """Offline provider for tests: replays canned chunks, optionally with a delay between them."""
+
+    def __init__(self, chunks: List[str], delay: float = 0.0):
+        self.chunks = chunks
+        self.delay = delay
+
+    async def generate(self, prompt: str) -> str:
+        return "".join(self.chunks)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        for chunk in self.chunks:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield chunk
+
+class StubProvider(FakeProvider):
+    """
+    Deterministic offline backend (AI_PROVIDER=stub) for load tests and local dev:
+    echoes the user's message back in word-sized chunks after a fixed latency.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__([], delay=0.0)
+        self.latency = latency
+
+    def _reply(self, prompt: str) -> List[str]:
+        match = re.search(r"User says: (.*)", prompt)
+        said = match.group(1).strip() if match else ""
+        return [f"{word} " for word in f"Homie (offline) heard you: {said}".split()]
+
+    async def generate(self, prompt: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return "".join(self._reply(prompt)).strip()
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._reply(prompt):
+            yield chunk
+
+class ProviderUnavailable(Exception):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for `reset_timeout`
+    seconds. Then lets a single trial call through: success closes it, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
 
+    def release(self):
+        """A call was abandoned (cancelled) before it could succeed or fail."""
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "short_circuited": self.short_circuited}
+
+class GuardedProvider:
+    """
+    Wraps a provider with a concurrency cap, a per-call deadline (queueing included)
+    and a circuit breaker, so an outage costs callers nothing but the fallback reply.
+    """
+
+    def __init__(self, inner, max_concurrency: int, timeout: float, breaker: CircuitBreaker):
+        self.inner = inner
+        self.timeout = timeout
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, prompt: str) -> str:
+        if not self.breaker.allow():
+            raise ProviderUnavailable()
+        try:
+            async with asyncio.timeout(self.timeout):
+                async with self._semaphore:
+                    text = await self.inner.generate(prompt)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # The timeout budget only counts time spent waiting on the provider: each wait is
+        # bounded separately and nothing is yielded inside a timeout scope, so the consumer's
+        # time between chunks is free and a timeout always surfaces here as TimeoutError.
+        if not self.breaker.allow():
+            raise ProviderUnavailable()
+        loop = asyncio.get_running_loop()
+        remaining = self.timeout
+        chunks = None
+        acquired = False
+        try:
+            started = loop.time()
+            await asyncio.wait_for(self._semaphore.acquire(), remaining)
+            acquired = True
+            remaining -= loop.time() - started
+            chunks = self.inner.stream(prompt).__aiter__()
+            while True:
+                if remaining <= 0:
+                    raise TimeoutError()
+                started = loop.time()
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), remaining)
+                except StopAsyncIteration:
+                    break
+                remaining -= loop.time() - started
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            if chunks is not None and hasattr(chunks, "aclose"):
+                await chunks.aclose()
+            if acquired:
+                self._semaphore.release()
+        self.breaker.record_success()
+
+breaker = CircuitBreaker(settings.AI_BREAKER_FAILURES, settings.AI_BREAKER_RESET_SECONDS)
+_provider = None
+
+def guard(provider) -> GuardedProvider:
+    return GuardedProvider(provider, settings.AI_PROVIDER_CONCURRENCY, settings.AI_CALL_TIMEOUT_SECONDS, breaker)
+
+def set_provider(provider):
+    """Swap the model backend (e.g. a FakeProvider in tests). None restores the default."""
+    global _provider
+    _provider = guard(provider) if provider is not None else None
+
+def get_provider():
+    """The process-wide provider: built once, then reused for every call."""
+    global _provider
+    if _provider is None:
+        if settings.AI_PROVIDER == "stub":
+            _provider = guard(StubProvider(settings.AI_STUB_LATENCY_MS / 1000))
+        elif os.getenv("GEMINI_API_KEY"):
+            _provider = guard(GeminiProvider())
+    return _provider
+
+# Tiered resolution: local intent parser -> response cache -> model.
+# Only plain answers are cached: a reply with tool calls acts on the group, and
+# replaying it from the cache would create the task or expense a second time.
+response_cache = TTLCache(maxsize=settings.AI_CACHE_MAX_SIZE, ttl=settings.AI_CACHE_TTL_SECONDS)
+_counters = {"lookups": 0, "intent_hits": 0, "model_calls": 0, "model_errors": 0}
+
+INTENT_REPLIES = {
+    "create_task": "On it! Adding that to the chore list 📝",
+    "create_expense": "On it! Logging that expense 💸",
+}
+
+def normalize_prompt(message: str) -> str:
+    """Cache key: addressing, case, punctuation and spacing don't change the answer."""
+    text = re.sub(r"[^\w\s$.]", " ", strip_homie(message).lower())
+    return " ".join(text.split()).strip(" .")
+
+# Words that point back into the conversation ("what about that?", "do it again")
+REFERS_BACK = re.compile(r"\b(it|its|that|this|those|these|them|they|their|he|she|him|her|his|hers|"
+                         r"above|earlier|before|again|previous|same|said)\b")
+
+def cache_key(message: str, group_id: Optional[str] = None) -> Optional[str]:
+    """
+    The same self-contained question in the same group gets the same reply, whatever was
+    said around it. Messages that refer back to the conversation aren't cached (None).
+    """
+    prompt = normalize_prompt(message)
+    if REFERS_BACK.search(prompt):
+        return None
+    return f"{group_id or ''}|{prompt}"
+
+def resolve_locally(message: str, key: Optional[str]) -> Optional[dict]:
+    """Tiers 1 and 2. None means the model has to answer."""
+    _counters["lookups"] += 1
+    intent = parse_intent(strip_homie(message), strict=True)
+    if intent is not None:
+        _counters["intent_hits"] += 1
+        return {"text": INTENT_REPLIES[intent["tool"]], "tool_calls": [intent]}
+    cached = response_cache.get(key) if key is not None else None
+    if cached is not None:
+        return {"text": cached, "tool_calls": []}
+    return None
+
+def remember(key: Optional[str], result: dict):
+    if key is not None and not result["tool_calls"]:
+        response_cache.set(key, result["text"])
+
+def failure_reply(error: Exception) -> dict:
+    if isinstance(error, ProviderUnavailable):
+        return {"text": "Homie is taking a quick nap 😴 Try me again in a minute!", "tool_calls": []}
+    if isinstance(error, TimeoutError):
+        return {"text": "Ouch, my brain is slow today... try again? 🐢", "tool_calls": []}
+    return {"text": f"Ouch, my brain hurts: {str(error)}", "tool_calls": []}
+
+def resolver_stats() -> dict:
+    lookups = _counters["lookups"]
+    return {
+        "lookups": lookups,
+        "intent": {
+            "hits": _counters["intent_hits"],
+            "hit_rate": round(_counters["intent_hits"] / lookups, 3) if lookups else 0.0,
+        },
+        "cache": response_cache.stats(),
+        "model": {
+            "calls": _counters["model_calls"],
+            "errors": _counters["model_errors"],
+            "breaker": breaker.stats(),
+        },
+    }
+
+async def get_homie_response(message: str, history: list = [], excerpt: str = "", group_id: Optional[str] = None):
+    key = cache_key(message, group_id)
+    local = resolve_locally(message, key)
+    if local is not None:
+        return local
+
+    provider = get_provider()
+    if provider is None:
+        return dict(NO_KEY_REPLY)
+
+    _counters["model_calls"] += 1
+    try:
+        text = await provider.generate(build_prompt(message, history, excerpt))
+    except Exception as e:
+        _counters["model_errors"] += 1
+        return failure_reply(e)
+    result = parse_homie_output(text)
+    remember(key, result)
+    return result
+
+async def stream_homie_response(message: str, history: list = [], excerpt: str = "", group_id: Optional[str] = None) -> AsyncIterator[dict]:
+    """
+    Streaming variant of get_homie_response.
+    Yields {"delta": str} as reply text arrives, then one final
+    {"done": True, "text": ..., "tool_calls": [...]} parsed from the full completion.
+    TOOL: lines and old-style JSON replies are never forwarded as deltas.
+    Intent and cache hits skip the model and yield only the final event.
+    """
+    key = cache_key(message, group_id)
+    local = resolve_locally(message, key)
+    if local is not None:
+        yield {"done": True, **local}
+        return
+
+    provider = get_provider()
+    if provider is None:
+        yield {"done": True, **NO_KEY_REPLY}
+        return
+
+    _counters["model_calls"] += 1
+    text = ""
+    emitted = 0
+    try:
+        async for chunk in provider.stream(build_prompt(message, history, excerpt)):
+            text += chunk
+            if text.lstrip().startswith(("{", "`")):
+                continue  # JSON reply, only usable once complete
+            marker = text.find(TOOL_MARKER)
+            # Hold back a tail that could be the start of a TOOL: marker
+            safe = marker if marker >= 0 else len(text) - len(TOOL_MARKER) + 1
+            if safe > emitted:
+                yield {"delta": text[emitted:safe]}
+                emitted = safe
     except Exception as e:
-        return {"text": f"Ouch, my brain hurts: {str(e)}", "tool_calls": []}
+        _counters["model_errors"] += 1
+        yield {"done": True, **failure_reply(e)}
+        return
+
+    result = parse_homie_output(text)
+    remember(key, result)
+    if emitted < len(text) and TOOL_MARKER not in text and not text.lstrip().startswith(("{", "`")):
+        yield {"delta": text[emitted:]}
+    yield {"done": True, **result}
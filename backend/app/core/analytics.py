@@ -0,0 +1,92 @@
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from sqlalchemy import Date, cast, delete, false, func, insert, select, union_all
+from sqlalchemy.orm import Session
+
+from app.core.database import upsert
+from app.core.points import period_start
+from app.models.expense import Expense, ExpenseArchive, ExpenseRollup
+
+# Spending analytics read `expense_rollups`: one row per (group, month, category, payer,
+# subscription or not), bumped in the same transaction as each expense write. Dashboards
+# group those rows, so their cost depends on the number of buckets, not of expenses.
+# Settling doesn't touch the rollups - analytics cover the whole history.
+
+ROLLUP_KEY = ["group_id", "month", "category", "paid_by_id", "is_subscription"]
+
+def _bump(db: Session, group_id: str, month: date, category: str, paid_by_id: str, is_subscription: bool,
+          total: Decimal, count: int):
+    stmt = upsert(db, ExpenseRollup).values(
+        group_id=group_id, month=month, category=category, paid_by_id=paid_by_id,
+        is_subscription=is_subscription, total=total, expense_count=count,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=ROLLUP_KEY,
+        set_={
+            ExpenseRollup.total: ExpenseRollup.total + stmt.excluded.total_cents,
+            ExpenseRollup.expense_count: ExpenseRollup.expense_count + stmt.excluded.expense_count,
+        },
+    ))
+
+def record_expense(db: Session, expense: Expense, sign: int = 1):
+    """Add an expense (sign=-1 removes it) to its bucket. The caller commits."""
+    # created_at is a server default, so a pending expense falls in the current month
+    month = period_start("month", expense.created_at or datetime.utcnow())
+    _bump(db, expense.group_id, month, expense.category, expense.paid_by_id, bool(expense.is_subscription),
+          sign * expense.amount, sign)
+
+def record_expenses(db: Session, rows: List[dict]):
+    """Add many expense rows (dicts of Expense attributes) with one upsert per touched bucket."""
+    buckets = defaultdict(lambda: [Decimal("0.00"), 0])
+    now = datetime.utcnow()
+    for row in rows:
+        key = (row["group_id"], period_start("month", row.get("created_at") or now), row["category"],
+               row["paid_by_id"], bool(row.get("is_subscription")))
+        buckets[key][0] += row["amount"]
+        buckets[key][1] += 1
+    for key, (total, count) in buckets.items():
+        _bump(db, *key, total, count)
+
+def month_of(db: Session, column):
+    """SQL for the 1st of the (UTC) month of a timestamp column."""
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.date_trunc("month", func.timezone("UTC", column)), Date)
+    return func.date(column, "start of month")
+
+def rebuild(db: Session, group_id: Optional[str] = None) -> int:
+    """
+    Recompute the rollups (all groups, or one) from expenses and expense_archive as a single
+    INSERT ... SELECT ... GROUP BY, so backfills run in the database rather than row by row.
+    Returns the number of buckets written; the caller commits.
+    """
+    sources = []
+    for model in (Expense, ExpenseArchive):
+        source = select(
+            model.group_id, month_of(db, model.created_at).label("month"), model.category, model.paid_by_id,
+            func.coalesce(model.is_subscription, false()).label("is_subscription"), model.amount.label("cents"),
+        )
+        if group_id is not None:
+            source = source.where(model.group_id == group_id)
+        sources.append(source)
+    rows = union_all(*sources).subquery()
+    buckets = select(
+        rows.c.group_id, rows.c.month, rows.c.category, rows.c.paid_by_id, rows.c.is_subscription,
+        func.sum(rows.c.cents), func.count(),
+    ).group_by(rows.c.group_id, rows.c.month, rows.c.category, rows.c.paid_by_id, rows.c.is_subscription)
+
+    clear = delete(ExpenseRollup)
+    if group_id is not None:
+        clear = clear.where(ExpenseRollup.group_id == group_id)
+    db.execute(clear)
+    result = db.execute(insert(ExpenseRollup).from_select(
+        [getattr(ExpenseRollup, c) for c in ROLLUP_KEY] + [ExpenseRollup.total, ExpenseRollup.expense_count], buckets))
+    return result.rowcount
+
+def months_back(months: int) -> date:
+    """1st of the month `months - 1` months before this one (months=12: the last 12 calendar months)."""
+    first = period_start("month")
+    index = first.year * 12 + first.month - 1 - (months - 1)
+    return date(index // 12, index % 12 + 1, 1)
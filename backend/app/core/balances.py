@@ -0,0 +1,150 @@
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.orm import Session
+
+from app.core.database import upsert
+from app.core.money import from_cents, to_cents
+from app.models.expense import Expense, ExpenseBalance
+from app.models.user import Group, GroupMember, User
+
+# Per-group, per-payer running totals of `expenses`, updated in the same transaction as
+# every expense write so balances never have to scan the expenses table.
+
+def lock_groups(db: Session, group_ids):
+    """
+    Lock the groups' rows until the caller's transaction ends. Every running-total write and
+    every settle-up takes it first, so an expense lands wholly before or after a settlement,
+    even for a payer with no balance row yet. Ids are locked in order so multi-group writers
+    can't deadlock.
+    """
+    ids = sorted(set(group_ids))
+    if db.get_bind().dialect.name == "sqlite":
+        # No FOR UPDATE in SQLite (and the driver runs plain SELECTs outside the transaction):
+        # a no-op write takes the database write lock instead, and later reads see the latest data
+        db.execute(update(Group).where(Group.id.in_(ids)).values(id=Group.id)
+                   .execution_options(synchronize_session=False))
+        return
+    db.query(Group.id).filter(Group.id.in_(ids)).order_by(Group.id).with_for_update().all()
+
+def record_expense(db: Session, group_id: str, paid_by_id: str, amount: Decimal, count: int = 1):
+    """Add an expense (or, with negative amount/count, remove one) to the payer's running total."""
+    lock_groups(db, [group_id])
+    stmt = upsert(db, ExpenseBalance).values(group_id=group_id, user_id=paid_by_id, paid=amount, expense_count=count)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["group_id", "user_id"],
+        set_={
+            ExpenseBalance.paid: ExpenseBalance.paid + stmt.excluded.paid_cents,
+            ExpenseBalance.expense_count: ExpenseBalance.expense_count + stmt.excluded.expense_count,
+        },
+    ))
+
+def reset_group(db: Session, group_id: str):
+    db.execute(delete(ExpenseBalance).where(ExpenseBalance.group_id == group_id))
+
+def paid_totals(db: Session, group_id: str) -> Dict[str, Decimal]:
+    rows = db.query(ExpenseBalance.user_id, ExpenseBalance.paid).filter(ExpenseBalance.group_id == group_id).all()
+    return {user_id: paid for user_id, paid in rows}
+
+def compute_balances(db: Session, group_id: str) -> dict:
+    """
+    Open-epoch totals, each member's share and the transfers that settle them.
+    Reads one row per member and one per payer, never the expenses themselves.
+    """
+    # Current members (one row each) and the running totals per payer - no expense scan
+    members = db.query(GroupMember.user_id, User.full_name).join(User, User.id == GroupMember.user_id)\
+                .filter(GroupMember.group_id == group_id).all()
+    num_members = len(members)
+    if num_members == 0: return {"total": 0, "debts": []}
+
+    # Everything below is integer cents, so shares and transfers add up exactly
+    member_ids = sorted(user_id for user_id, _ in members)
+    user_names = {user_id: full_name for user_id, full_name in members}
+    paid_by_user = {user_id: 0 for user_id in member_ids}
+    for user_id, paid in paid_totals(db, group_id).items():
+        # Ex-members who paid still get credit, but don't owe a share
+        paid_by_user[user_id] = to_cents(paid)
+        user_names.setdefault(user_id, "Ex-Member")
+
+    total_spent = sum(paid_by_user.values())
+    share, remainder = divmod(total_spent, num_members)
+    # The leftover cents go one each to the first members
+    owed = {uid: share + (1 if i < remainder else 0) for i, uid in enumerate(member_ids)}
+
+    # Calculate Net
+    balances_by_user = {uid: paid - owed.get(uid, 0) for uid, paid in paid_by_user.items()}
+
+    # Create Transfers (Greedy algorithm)
+    debtors = [{'id': uid, 'amount': -bal} for uid, bal in balances_by_user.items() if bal < 0]
+    creditors = [{'id': uid, 'amount': bal} for uid, bal in balances_by_user.items() if bal > 0]
+    debtors.sort(key=lambda x: x['amount'], reverse=True)
+    creditors.sort(key=lambda x: x['amount'], reverse=True)
+    
+    transfers = []
+    i = 0
+    j = 0
+    while i < len(debtors) and j < len(creditors):
+        debt = debtors[i]
+        credit = creditors[j]
+        
+        amount = min(debt['amount'], credit['amount'])
+        transfers.append({
+            "from": user_names.get(debt['id'], "Unknown"),
+            "to": user_names.get(credit['id'], "Unknown"),
+            "amount": from_cents(amount)
+        })
+            
+        debt['amount'] -= amount
+        credit['amount'] -= amount
+        
+        if debt['amount'] == 0: i += 1
+        if credit['amount'] == 0: j += 1
+        
+    return {
+        "total": from_cents(total_spent),
+        "share_per_person": from_cents(share),
+        "transfers": transfers,
+        "paid": [
+            {"user_id": uid, "name": user_names.get(uid, "Unknown"), "amount": from_cents(cents)}
+            for uid, cents in paid_by_user.items()
+        ],
+    }
+
+def check_consistency(db: Session, group_id: Optional[str] = None, repair: bool = False) -> List[dict]:
+    """
+    Rebuild totals from the open (unsettled) expense rows with one GROUP BY and report every payer
+    whose stored total drifted. repair=True overwrites the stored totals; the caller commits.
+    """
+    if repair and group_id is not None:
+        lock_groups(db, [group_id])  # compare and rewrite without expense writes in between
+    actual = db.query(Expense.group_id, Expense.paid_by_id, func.sum(Expense.amount), func.count(Expense.id))\
+               .filter(Expense.settlement_id.is_(None))\
+               .group_by(Expense.group_id, Expense.paid_by_id)
+    stored = db.query(ExpenseBalance)
+    if group_id is not None:
+        actual = actual.filter(Expense.group_id == group_id)
+        stored = stored.filter(ExpenseBalance.group_id == group_id)
+
+    zero = Decimal("0.00")
+    expected = {(g, u): (total or zero, count) for g, u, total, count in actual}
+    current = {(b.group_id, b.user_id): (b.paid, b.expense_count) for b in stored}
+
+    drift = []
+    for key in expected.keys() | current.keys():
+        want_paid, want_count = expected.get(key, (zero, 0))
+        have_paid, have_count = current.get(key, (zero, 0))
+        if want_paid != have_paid or want_count != have_count:
+            drift.append({
+                "group_id": key[0], "user_id": key[1],
+                "stored": have_paid, "actual": want_paid,
+                "stored_count": have_count, "actual_count": want_count,
+            })
+
+    if repair and drift:
+        for item in drift:
+            db.execute(delete(ExpenseBalance).where(
+                ExpenseBalance.group_id == item["group_id"], ExpenseBalance.user_id == item["user_id"]))
+            if item["actual_count"]:
+                record_expense(db, item["group_id"], item["user_id"], item["actual"], item["actual_count"])
+    return drift
@@ -0,0 +1,137 @@
+import asyncio
+import calendar
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core import analytics, balances
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.email import outbox_worker, queue_bill_reminder
+from app.models.expense import Expense, Subscription
+from app.models.user import User, generate_uuid
+
+# Subscriptions are charged by a periodic run: every active subscription whose billing day
+# has come this month and that hasn't been charged for this month gets one new expense.
+# Each batch commits its charges together with `last_billed_period`, so a run that dies
+# half way simply carries on with the remaining subscriptions next time, and re-runs are no-ops.
+# Reminders are queued in the email outbox in that same transaction.
+
+def cutoff_day(today: date) -> int:
+    """Highest billing_day due today: on the last day of a short month, days up to 31 are due too."""
+    if today.day == calendar.monthrange(today.year, today.month)[1]:
+        return 31
+    return today.day
+
+def due_date(period: date, billing_day: int) -> date:
+    return period.replace(day=min(billing_day, calendar.monthrange(period.year, period.month)[1]))
+
+def charge(db: Session, subscriptions: List[Subscription], period: date) -> int:
+    """Insert this period's charge for each subscription, queue the reminders and mark them billed. The caller commits."""
+    rows = [{
+        "id": generate_uuid(),
+        "description": sub.description,
+        "amount": sub.amount,
+        "category": sub.category,
+        "is_subscription": True,
+        "billing_day": sub.billing_day,
+        "paid_by_id": sub.paid_by_id,
+        "group_id": sub.group_id,
+        "subscription_id": sub.id,
+        "billing_period": period,
+    } for sub in subscriptions]
+    balances.lock_groups(db, {sub.group_id for sub in subscriptions})  # all up front, in order
+    db.execute(insert(Expense), rows)
+    for row in rows:
+        balances.record_expense(db, row["group_id"], row["paid_by_id"], row["amount"])
+        analytics.record_expense(db, Expense(**row))
+    payers = dict(db.query(User.id, User).filter(User.id.in_({sub.paid_by_id for sub in subscriptions})).all())
+    for sub in subscriptions:
+        payer = payers.get(sub.paid_by_id)
+        if payer is not None:
+            queue_bill_reminder(db, payer.email, payer.full_name, sub.description, sub.amount,
+                                due_date(period, sub.billing_day).isoformat(),
+                                dedupe_key=f"bill:{sub.id}:{period.isoformat()}")
+    db.execute(update(Subscription)
+               .where(Subscription.id.in_([sub.id for sub in subscriptions]))
+               .values(last_billed_period=period)
+               .execution_options(synchronize_session=False))
+    return len(rows)
+
+def run_billing(today: Optional[date] = None, batch_size: int = settings.BILLING_BATCH_SIZE) -> int:
+    """
+    Charge every subscription due by `today` (UTC) for the current month, one batch per
+    transaction. Only due rows are read (ix_subscriptions_billing_day_group) and concurrent
+    runs skip each other's locked rows. Returns the number of charges.
+    """
+    today = today or datetime.utcnow().date()
+    period = today.replace(day=1)
+    charged = 0
+    while True:
+        with SessionLocal() as db:
+            batch = db.query(Subscription).filter(
+                Subscription.billing_day <= cutoff_day(today),
+                Subscription.active == True,
+                or_(Subscription.last_billed_period.is_(None), Subscription.last_billed_period < period),
+            ).order_by(Subscription.billing_day, Subscription.group_id)\
+             .limit(batch_size).with_for_update(skip_locked=True).all()
+            if not batch:
+                return charged
+            try:
+                charged += charge(db, batch, period)
+                db.commit()
+            except IntegrityError as e:
+                # Another run charged some of these first
+                db.rollback()
+                print(f"⚠️ Billing batch skipped: {e.orig}")
+                return charged
+
+class BillingScheduler:
+    """Runs `run_billing` in a worker thread every `interval` seconds."""
+
+    def __init__(self, interval: float = settings.BILLING_RUN_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.charged = 0
+        self.failed = 0
+        self.last_run_at: Optional[datetime] = None
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                charged = await asyncio.to_thread(run_billing)
+                self.charged += charged
+                self.runs += 1
+                self.last_run_at = datetime.utcnow()
+                if charged:
+                    outbox_worker.kick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Billing run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "charged": self.charged,
+            "failed": self.failed,
+            "last_run_at": str(self.last_run_at) if self.last_run_at else None,
+        }
+
+billing_scheduler = BillingScheduler()
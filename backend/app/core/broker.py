@@ -0,0 +1,114 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+
+# handler(channel, payload) - payload is the already-serialized JSON string
+Handler = Callable[[str, str], Awaitable[None]]
+
+class Broker:
+    """
+    Pub/sub fan-out between workers.
+    A worker subscribes to a channel only while it has local listeners for it.
+    """
+
+    async def publish(self, channel: str, payload: str):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, handler: Handler):
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str, handler: Optional[Handler] = None):
+        """Stop delivering `channel` to `handler` (to every handler when None)."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class InMemoryBroker(Broker):
+    """
+    Single-process backend (the default). Several managers can share one instance,
+    which is how tests stand in for multiple workers without Redis.
+    """
+
+    def __init__(self):
+        # channel -> list of handlers (one per subscribed manager)
+        self.handlers: Dict[str, list] = {}
+
+    async def publish(self, channel: str, payload: str):
+        for handler in list(self.handlers.get(channel, ())):
+            await handler(channel, payload)
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.handlers.setdefault(channel, []).append(handler)
+
+    async def unsubscribe(self, channel: str, handler: Optional[Handler] = None):
+        handlers = self.handlers.get(channel)
+        if not handlers:
+            return
+        if handler is None:
+            handlers.clear()
+        elif handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            del self.handlers[channel]
+
+class RedisBroker(Broker):
+    """Redis pub/sub backend. One connection per worker, one reader task dispatching to handlers."""
+
+    def __init__(self, url: str, client=None):
+        # `client` lets tests pass a fakeredis.aioredis instance
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.handlers: Dict[str, Handler] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    async def publish(self, channel: str, payload: str):
+        await self.client.publish(channel, payload)
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.handlers[channel] = handler
+        await self.pubsub.subscribe(channel)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+
+    async def unsubscribe(self, channel: str, handler: Optional[Handler] = None):
+        if handler is not None and self.handlers.get(channel) != handler:
+            return
+        if self.handlers.pop(channel, None) is not None:
+            await self.pubsub.unsubscribe(channel)
+
+    async def _read_loop(self):
+        while self.handlers:
+            try:
+                msg = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Broker read failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if not msg or msg.get("type") != "message":
+                continue
+            handler = self.handlers.get(msg["channel"])
+            if handler is None:
+                continue
+            try:
+                await handler(msg["channel"], msg["data"])
+            except Exception as e:
+                print(f"❌ Broker handler failed: {e}")
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        self.handlers.clear()
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+def create_broker() -> Broker:
+    if settings.REDIS_URL:
+        return RedisBroker(settings.REDIS_URL)
+    return InMemoryBroker()
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -9,6 +10,85 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./database_v2.db"
 
+    # Auth principal cache (token -> user snapshot)
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 4096
+
+    # Group membership cache (user_id -> groups)
+    MEMBERSHIP_CACHE_TTL_SECONDS: int = 300
+    MEMBERSHIP_CACHE_MAX_SIZE: int = 4096
+
+    # Chat fan-out. Unset = in-process broker (single worker only)
+    REDIS_URL: Optional[str] = None
+    # Outbound frames buffered per socket before a slow client is evicted
+    CHAT_SEND_QUEUE_SIZE: int = 256
+    # Messages replayed on connect, kept in a per-group ring buffer
+    CHAT_HISTORY_SIZE: int = 50
+    # Write-behind chat persistence: flush every N messages or every few ms
+    CHAT_PERSIST_BATCH_SIZE: int = 200
+    CHAT_PERSIST_INTERVAL_MS: int = 10
+    CHAT_PERSIST_MAX_QUEUE: int = 10000
+
+    # Homie (AI) background jobs
+    AI_MAX_CONCURRENCY: int = 8
+    AI_PER_GROUP_CONCURRENCY: int = 1
+    AI_MAX_PENDING: int = 100
+    AI_TIMEOUT_SECONDS: float = 30.0
+    AI_STREAMING: bool = True
+    # Normalized prompt -> reply cache in front of the model
+    AI_CACHE_TTL_SECONDS: int = 3600
+    AI_CACHE_MAX_SIZE: int = 2048
+    # Homie's view of the chat: recent turns within a token budget + shortened lines of older ones
+    AI_CONTEXT_TOKENS: int = 600
+    AI_EXCERPT_TOKENS: int = 200
+    AI_EXCERPT_TTL_SECONDS: int = 6 * 3600
+    AI_EXCERPT_MAX_GROUPS: int = 1024
+
+    # Recurring chores: occurrences are created this far ahead by a periodic sweep (0 disables it)
+    RECURRENCE_HORIZON_DAYS: int = 14
+    RECURRENCE_SWEEP_SECONDS: int = 300
+    RECURRENCE_BATCH_SIZE: int = 500
+    RECURRENCE_MAX_PER_SERIES: int = 62
+
+    # Settled expenses move from `expenses` to `expense_archive` in batches (0 seconds disables)
+    SETTLEMENT_ARCHIVE_SECONDS: int = 600
+    SETTLEMENT_ARCHIVE_BATCH: int = 500
+
+    # Subscription billing: due subscriptions are charged (once per month) by a periodic run (0 disables it)
+    BILLING_RUN_SECONDS: int = 6 * 3600
+    BILLING_BATCH_SIZE: int = 500
+
+    # Email outbox: batch size, idle poll, SMTP connections kept open, retry backoff (base doubles per attempt)
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50
+    EMAIL_OUTBOX_POLL_SECONDS: float = 10.0
+    EMAIL_SMTP_CONNECTIONS: int = 2
+    EMAIL_SMTP_TIMEOUT_SECONDS: float = 30.0
+    EMAIL_MAX_ATTEMPTS: int = 8
+    EMAIL_RETRY_BASE_SECONDS: float = 30.0
+    EMAIL_RETRY_MAX_SECONDS: float = 6 * 3600
+
+    # CSV import/export: rows per import transaction, rows fetched per round trip when exporting,
+    # largest accepted import file (imports are streamed, so this only bounds the work per request)
+    CSV_IMPORT_CHUNK_ROWS: int = 1000
+    CSV_EXPORT_BATCH_ROWS: int = 1000
+    CSV_IMPORT_MAX_BYTES: int = 100 * 1024 * 1024
+
+    # Image uploads (avatars, task proofs)
+    UPLOAD_MAX_BYTES: int = 15 * 1024 * 1024
+    # Resized WebP variants (thumb/medium), rendered in a process pool (0 workers disables)
+    IMAGE_WORKERS: int = 2
+    IMAGE_QUALITY: int = 80
+    # After a failed render the original is served without re-rendering for a while (base doubles per failure)
+    IMAGE_RETRY_BASE_SECONDS: float = 60.0
+    IMAGE_RETRY_MAX_SECONDS: float = 24 * 3600
+    # Model provider: "gemini" (needs GEMINI_API_KEY) or "stub" (offline, deterministic)
+    AI_PROVIDER: str = "gemini"
+    AI_STUB_LATENCY_MS: int = 0
+    AI_PROVIDER_CONCURRENCY: int = 8
+    AI_CALL_TIMEOUT_SECONDS: float = 20.0
+    AI_BREAKER_FAILURES: int = 5
+    AI_BREAKER_RESET_SECONDS: float = 30.0
+
     class Config:
         case_sensitive = True
 
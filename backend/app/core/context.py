@@ -0,0 +1,81 @@
+import json
+from typing import List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# Conversation context for Homie: the newest chat turns that fit a token budget, plus a
+# rolling per-group excerpt of the turns that scrolled out of that window. The excerpt is
+# not a summary - it keeps the most recent of those older turns, each cut to one short line.
+
+EXCERPT_LINE_CHARS = 120
+
+class RollingExcerpt:
+    __slots__ = ("lines", "tokens", "until")
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.tokens = 0
+        self.until: Optional[tuple] = None  # (created_at, id) of the newest folded turn
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+excerpts = TTLCache(maxsize=settings.AI_EXCERPT_MAX_GROUPS, ttl=settings.AI_EXCERPT_TTL_SECONDS)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap tokenizer stand-in (~4 characters per token), close enough for budgeting."""
+    return len(text) // 4 + 1
+
+def format_turn(frame: dict) -> str:
+    return f"{frame.get('sender_name') or 'Unknown'}: {frame.get('content', '')}"
+
+def _position(frame: dict) -> tuple:
+    return (frame.get("created_at") or "", frame.get("id") or "")
+
+def fold(group_id: str, frames: List[dict]) -> str:
+    """
+    Add turns newer than the excerpt's cursor to the group's excerpt (shortened) and return it.
+    Only the new turns are touched; the oldest lines are dropped once over budget.
+    """
+    excerpt = excerpts.get(group_id)
+    if excerpt is None:
+        excerpt = RollingExcerpt()
+        excerpts.set(group_id, excerpt)
+    for frame in frames:
+        position = _position(frame)
+        if excerpt.until is not None and position <= excerpt.until:
+            continue
+        line = format_turn(frame)
+        if len(line) > EXCERPT_LINE_CHARS:
+            line = line[:EXCERPT_LINE_CHARS - 1] + "…"
+        excerpt.lines.append(line)
+        excerpt.tokens += estimate_tokens(line)
+        excerpt.until = position
+    while excerpt.lines and excerpt.tokens > settings.AI_EXCERPT_TOKENS:
+        excerpt.tokens -= estimate_tokens(excerpt.lines.pop(0))
+    return excerpt.text
+
+def build_context(group_id: str, payloads: List[str], exclude_id: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Split recent history frames (serialized, oldest first) into (excerpt, window):
+    `window` is the newest turns within AI_CONTEXT_TOKENS, everything older is folded
+    into the group's rolling excerpt. `exclude_id` drops the message being answered.
+    """
+    frames = [json.loads(p) for p in payloads]
+    frames = [f for f in frames if f.get("id") != exclude_id and f.get("content")]
+
+    window: List[str] = []
+    used = 0
+    for frame in reversed(frames):
+        line = format_turn(frame)
+        cost = estimate_tokens(line)
+        if used + cost > settings.AI_CONTEXT_TOKENS:
+            break
+        window.append(line)
+        used += cost
+    window.reverse()
+
+    older = frames[:len(frames) - len(window)]
+    return fold(group_id, older), window
@@ -0,0 +1,65 @@
+import csv
+import io
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Sequence, Tuple
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+
+# CSV export and import. Exports are generators over `Query.yield_per`, written out a
+# batch of rows at a time, so a response streams in constant memory whatever the history
+# size. Imports parse the upload in fixed-size chunks and hand each chunk to a callback
+# that validates it and writes it with bulk statements in one transaction.
+
+Chunk = List[Tuple[int, dict]]  # (line number, {column: value}) per data row
+
+def stream_csv(header: Sequence[str], rows: Iterable[Sequence], flush_every: int = settings.CSV_EXPORT_BATCH_ROWS) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(["" if value is None else value for value in row])
+        if n % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def read_chunks(file: BinaryIO, chunk_size: int = settings.CSV_IMPORT_CHUNK_ROWS) -> Iterator[Chunk]:
+    """Rows with lower-cased column names and blank cells dropped (so they fall back to defaults)."""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text)
+        chunk: Chunk = []
+        for row in reader:
+            values = {k.strip().lower(): v.strip() for k, v in row.items() if isinstance(k, str) and isinstance(v, str) and v.strip()}
+            if not values:
+                continue
+            chunk.append((reader.line_num, values))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        text.detach()  # the upload is closed by FastAPI, not by us
+
+def row_error(line: int, error) -> dict:
+    if isinstance(error, ValidationError):
+        error = "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+    return {"row": line, "error": str(error)}
+
+def import_csv(file: BinaryIO, apply_chunk: Callable[[Chunk], Tuple[int, List[dict]]]) -> dict:
+    """
+    Feed the upload to `apply_chunk` chunk by chunk. It returns (rows written, row errors)
+    and commits its own transaction, so chunks before a bad one stay imported.
+    """
+    imported, errors = 0, []
+    try:
+        for chunk in read_chunks(file):
+            written, chunk_errors = apply_chunk(chunk)
+            imported += written
+            errors.extend(chunk_errors)
+    except (UnicodeDecodeError, csv.Error) as e:
+        errors.append({"row": None, "error": f"Unreadable CSV: {e}"})
+    return {"imported": imported, "failed": len(errors), "errors": errors}
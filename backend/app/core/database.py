@@ -46,3 +46,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def upsert(db, model):
+    """INSERT for `model` supporting .on_conflict_do_update() on both PostgreSQL and SQLite."""
+    from sqlalchemy.dialects import postgresql, sqlite
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
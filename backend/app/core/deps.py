@@ -0,0 +1,134 @@
+import time
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt, JWTError
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.security import ALGORITHM
+from app.models.user import User, GroupMember
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+
+# Columns kept in the principal cache. current_points and hashed_password are left out on
+# purpose: they lazy-load from the DB on access so balances are never served stale.
+CACHED_USER_COLUMNS = ("id", "email", "full_name", "avatar_url", "is_active", "created_at")
+
+# token -> (user_id, {column: value})
+user_cache = TTLCache(maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+
+def invalidate_user(user_id: str):
+    """Drop every cached token for this user. Call after profile changes or deletion."""
+    user_cache.pop_where(lambda entry: entry[0] == user_id)
+
+def _attach(snapshot: dict, db: Session) -> User:
+    # Rebuild a persistent User from the snapshot without a SELECT.
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    db.add(user)
+    return user
+
+def resolve_user(token: str, db: Session) -> Optional[User]:
+    """Token -> User, served from the principal cache when possible. Returns None if invalid."""
+    cached = user_cache.get(token)
+    if cached is not None:
+        return _attach(cached[1], db)
+
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        return None
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        return None
+
+    # Never outlive the token itself
+    ttl = settings.USER_CACHE_TTL_SECONDS
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    user_cache.set(token, (user.id, {c: getattr(user, c) for c in CACHED_USER_COLUMNS}), ttl=ttl)
+    return user
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    user = resolve_user(token, db)
+    if user is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+# user_id -> ((group_id, role), ...) in the order the DB returns them, same as the old .first()
+membership_cache = TTLCache(maxsize=settings.MEMBERSHIP_CACHE_MAX_SIZE, ttl=settings.MEMBERSHIP_CACHE_TTL_SECONDS)
+
+def invalidate_memberships(user_id: str):
+    """
+    Call after a user's group memberships change (create/join).
+    Only this process's cache is cleared; other workers catch up when their entry
+    expires, or sooner through the re-checks in is_member / get_group_context.
+    """
+    membership_cache.pop(user_id)
+
+def get_user_groups(user_id: str, db: Session, fresh: bool = False) -> tuple:
+    """
+    The user's (group_id, role) pairs. Users without a group aren't cached: they are
+    the ones about to create or join one, possibly through another worker.
+    """
+    groups = None if fresh else membership_cache.get(user_id)
+    if groups is None:
+        rows = db.query(GroupMember.group_id, GroupMember.role).filter(GroupMember.user_id == user_id).all()
+        groups = tuple((r.group_id, r.role) for r in rows)
+        if groups:
+            membership_cache.set(user_id, groups)
+        else:
+            membership_cache.pop(user_id)
+    return groups
+
+def is_member(user_id: str, group_id: str, db: Session) -> bool:
+    groups = get_user_groups(user_id, db)
+    if groups and group_id not in dict(groups):
+        groups = get_user_groups(user_id, db, fresh=True)  # may have joined through another worker
+    return group_id in dict(groups)
+
+class GroupContext:
+    """The group a request acts on. Mirrors the GroupMember fields handlers used to read."""
+
+    __slots__ = ("user_id", "group_id", "role")
+
+    def __init__(self, user_id: str, group_id: str, role: str):
+        self.user_id = user_id
+        self.group_id = group_id
+        self.role = role
+
+def get_group_context(
+    x_group_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Optional[GroupContext]:
+    """
+    Resolve the caller's group once per request.
+    Users in several groups pick one with the X-Group-Id header; otherwise the first
+    group is used. Returns None when the user has no group so handlers keep their own fallback.
+    """
+    groups = get_user_groups(current_user.id, db)
+    if x_group_id:
+        role = dict(groups).get(x_group_id)
+        if role is None and groups:
+            # Joined through another worker, so not in this worker's cache yet
+            role = dict(get_user_groups(current_user.id, db, fresh=True)).get(x_group_id)
+        if role is not None:
+            return GroupContext(current_user.id, x_group_id, role)
+        raise HTTPException(status_code=403, detail="Not a member")
+    if not groups:
+        return None
+    group_id, role = groups[0]
+    return GroupContext(current_user.id, group_id, role)
@@ -1,56 +1,45 @@
-from fastapi import BackgroundTasks
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from pydantic import EmailStr
-from typing import List
-from app.core.config import settings
+import asyncio
 import os
+import random
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import List, Optional
 
-# Ensure user adds these to .env later
-# For now, default to console print or dummy logic if keys missing
-
-class EmailService:
-    def __init__(self):
-        self.conf = ConnectionConfig(
-            MAIL_USERNAME = os.getenv("MAIL_USERNAME", "user@example.com"),
-            MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "password"),
-            MAIL_FROM = os.getenv("MAIL_FROM", "admin@homie-app.com"),
-            MAIL_PORT = int(os.getenv("MAIL_PORT", 587)),
-            MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com"),
-            MAIL_STARTTLS = True,
-            MAIL_SSL_TLS = False,
-            USE_CREDENTIALS = True,
-            VALIDATE_CERTS = True
-        )
-        self.fm = FastMail(self.conf)
-
-    async def send_email(self, email: EmailStr, subject: str, body: str):
-        """
-        Send an email via SMTP.
-        If credentials are dummy, this might fail or we can mock it.
-        For safety now: Try except and print to console if fail.
-        """
-        message = MessageSchema(
-            subject=subject,
-            recipients=[email],
-            body=body,
-            subtype=MessageType.html
-        )
+import aiosmtplib
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
 
-        try:
-            # Check if using dummy values
-            if "example.com" in self.conf.MAIL_USERNAME:
-                 print(f"📧 [MOCK EMAIL] To: {email} | Subject: {subject} | Body: {body}")
-                 return
+from app.core.config import settings
+from app.core.database import SessionLocal, upsert
+from app.models.outbox import OutboxEmail
+from app.models.user import generate_uuid
 
-            await self.fm.send_message(message)
-            print(f"📧 Sent email to {email}")
-        except Exception as e:
-            print(f"❌ Email failed: {e}")
-            print(f"📧 [FALLBACK] To: {email} | Subject: {subject} | Body: {body}")
+# Email goes through a transactional outbox: request handlers and jobs only insert an
+# `email_outbox` row in their own transaction (so a mail is queued exactly when the change
+# it reports commits), and the OutboxWorker below sends queued rows in batches over a
+# small pool of long-lived SMTP connections, retrying failures with exponential backoff.
+# Nothing on a request path ever talks to SMTP.
+
+# Ensure user adds these to .env later
+# Without real credentials, mail is printed to the console instead of sent
+MAIL_USERNAME = os.getenv("MAIL_USERNAME", "user@example.com")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "password")
+MAIL_FROM = os.getenv("MAIL_FROM", "admin@homie-app.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() == "true"
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "false").lower() == "true"
+MAIL_USE_CREDENTIALS = os.getenv("MAIL_USE_CREDENTIALS", "true").lower() == "true"  # false for a local sink (aiosmtpd)
 
-email_service = EmailService()
+def queue_email(db: Session, email: str, subject: str, body: str, dedupe_key: Optional[str] = None):
+    """Add a mail to the outbox in the caller's transaction. A repeated dedupe_key is ignored."""
+    stmt = upsert(db, OutboxEmail).values(
+        id=generate_uuid(), dedupe_key=dedupe_key, recipient=email, subject=subject, body=body,
+        status="pending", attempts=0, next_attempt_at=datetime.utcnow(),
+    )
+    db.execute(stmt.on_conflict_do_nothing(index_elements=["dedupe_key"]))
 
-async def send_welcome_email(email: EmailStr, name: str):
+def queue_welcome_email(db: Session, user_id: str, email: str, name: str):
     subject = "Welcome to Home & Friends! 🏠"
     body = f"""
     <h1>Welcome, {name}!</h1>
@@ -59,9 +48,10 @@ async def send_welcome_email(email: EmailStr, name: str):
     <br>
     <p>Cheers,<br>Homie Team</p>
     """
-    await email_service.send_email(email, subject, body)
+    queue_email(db, email, subject, body, dedupe_key=f"welcome:{user_id}")  # per account: a re-created account is welcomed again
 
-async def send_bill_reminder(email: EmailStr, name: str, bill_desc: str, amount: float, due_date: str):
+def queue_bill_reminder(db: Session, email: str, name: str, bill_desc: str, amount: float, due_date: str,
+                        dedupe_key: Optional[str] = None):
     subject = f"💸 Bill Reminder: {bill_desc}"
     body = f"""
     <h3>Hi {name},</h3>
@@ -73,4 +63,213 @@ async def send_bill_reminder(email: EmailStr, name: str, bill_desc: str, amount:
     </ul>
     <p>Don't forget to mark it as paid via the Dashboard!</p>
     """
-    await email_service.send_email(email, subject, body)
+    queue_email(db, email, subject, body, dedupe_key=dedupe_key)
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff with jitter: base, 2x base, 4x base ... capped, +-20%."""
+    seconds = min(settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.EMAIL_RETRY_MAX_SECONDS)
+    return timedelta(seconds=seconds * random.uniform(0.8, 1.2))
+
+def claim_batch(batch_size: int, lease_seconds: float, max_attempts: int) -> List[OutboxEmail]:
+    """
+    Take up to `batch_size` due mails and lease them: they stay in 'sending' with
+    next_attempt_at pushed out, so a worker that dies mid-batch gives them back
+    once the lease runs out. Concurrent workers skip each other's locked rows.
+    Taking the lease counts as an attempt, so a mail whose send never reports back
+    (a worker crash, a hung connection) is given up on like any other failure.
+    """
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        db.execute(update(OutboxEmail)
+                   .where(OutboxEmail.status == "sending", OutboxEmail.next_attempt_at <= now,
+                          OutboxEmail.attempts >= max_attempts)
+                   .values(status="failed", last_error="Lease expired on the last attempt")
+                   .execution_options(synchronize_session=False))
+        batch = db.query(OutboxEmail).filter(
+            OutboxEmail.status.in_(("pending", "sending")),
+            OutboxEmail.next_attempt_at <= now,
+        ).order_by(OutboxEmail.next_attempt_at).limit(batch_size).with_for_update(skip_locked=True).all()
+        if batch:
+            db.execute(update(OutboxEmail)
+                       .where(OutboxEmail.id.in_([m.id for m in batch]))
+                       .values(status="sending", attempts=OutboxEmail.attempts + 1,
+                               next_attempt_at=now + timedelta(seconds=lease_seconds))
+                       .execution_options(synchronize_session=False))
+            db.expunge_all()  # keep the loaded rows usable after the session closes
+            for mail in batch:
+                mail.attempts += 1
+        db.commit()
+        return batch
+
+def record_results(sent: List[str], failed: List[tuple], max_attempts: int):
+    """One transaction per batch: mark sent mails, reschedule (or give up on) failed ones."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        if sent:
+            db.execute(update(OutboxEmail)
+                       .where(OutboxEmail.id.in_(sent))
+                       .values(status="sent", sent_at=now, last_error=None)
+                       .execution_options(synchronize_session=False))
+        for mail, error in failed:
+            # attempts was already counted when the mail was claimed
+            db.execute(update(OutboxEmail)
+                       .where(OutboxEmail.id == mail.id)
+                       .values(status="failed" if mail.attempts >= max_attempts else "pending",
+                               next_attempt_at=now + retry_delay(mail.attempts), last_error=str(error)[:500])
+                       .execution_options(synchronize_session=False))
+        db.commit()
+
+class SMTPPool:
+    """Up to `size` SMTP connections, opened on first use and kept open between batches."""
+
+    def __init__(self, size: int = settings.EMAIL_SMTP_CONNECTIONS):
+        self.size = size
+        self._idle: Optional[asyncio.Queue] = None
+        self.connects = 0
+
+    def _client(self) -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(
+            hostname=MAIL_SERVER, port=MAIL_PORT, use_tls=MAIL_SSL_TLS, start_tls=MAIL_STARTTLS,
+            username=MAIL_USERNAME if MAIL_USE_CREDENTIALS else None,
+            password=MAIL_PASSWORD if MAIL_USE_CREDENTIALS else None,
+            timeout=settings.EMAIL_SMTP_TIMEOUT_SECONDS,
+        )
+
+    async def send(self, message: EmailMessage):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.size):
+                self._idle.put_nowait(self._client())
+        client = await self._idle.get()
+        try:
+            for retry in (True, False):
+                try:
+                    if not client.is_connected:
+                        await client.connect()
+                        self.connects += 1
+                    await client.send_message(message)
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    # The server dropped an idle connection; reconnect once
+                    client.close()
+                    if not retry:
+                        raise
+        except Exception:
+            client.close()
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+    async def close(self):
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            client = self._idle.get_nowait()
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+        self._idle = None
+
+class OutboxWorker:
+    """Drains `email_outbox`: claims due mails in batches and sends them concurrently over the SMTP pool."""
+
+    def __init__(
+        self,
+        batch_size: int = settings.EMAIL_OUTBOX_BATCH_SIZE,
+        poll_interval: float = settings.EMAIL_OUTBOX_POLL_SECONDS,
+        max_attempts: int = settings.EMAIL_MAX_ATTEMPTS,
+        pool: Optional[SMTPPool] = None,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.pool = pool or SMTPPool()
+        # Mail from the default dummy account is printed, not sent
+        self.mock = "example.com" in MAIL_USERNAME and MAIL_USE_CREDENTIALS
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        if self.poll_interval > 0 and (self._task is None or self._task.done()):
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def kick(self):
+        """Send soon. Safe to call from the threadpool after a transaction that queued mail commits."""
+        if self._loop is not None and self._task is not None and not self._task.done():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.pool.close()
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.drain_once():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Email outbox failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain_once(self) -> int:
+        """Send one batch; returns how many mails it handled (0 when nothing is due)."""
+        lease = settings.EMAIL_SMTP_TIMEOUT_SECONDS * (self.batch_size // max(self.pool.size, 1) + 2)
+        batch = await asyncio.to_thread(claim_batch, self.batch_size, lease, self.max_attempts)
+        if not batch:
+            return 0
+        outcomes = await asyncio.gather(*(self._deliver(mail) for mail in batch), return_exceptions=True)
+        sent = [mail.id for mail, outcome in zip(batch, outcomes) if outcome is None]
+        failed = [(mail, outcome) for mail, outcome in zip(batch, outcomes) if outcome is not None]
+        await asyncio.to_thread(record_results, sent, failed, self.max_attempts)
+
+        self.batches += 1
+        self.sent += len(sent)
+        for mail, error in failed:
+            if mail.attempts >= self.max_attempts:
+                self.failed += 1
+                print(f"❌ Email to {mail.recipient} failed for good: {error}")
+            else:
+                self.retried += 1
+        return len(batch)
+
+    async def _deliver(self, mail: OutboxEmail):
+        if self.mock:
+            print(f"📧 [MOCK EMAIL] To: {mail.recipient} | Subject: {mail.subject} | Body: {mail.body}")
+            return
+        message = EmailMessage()
+        message["From"] = MAIL_FROM
+        message["To"] = mail.recipient
+        message["Subject"] = mail.subject
+        message["Message-ID"] = f"<{mail.id}@homie-app>"  # stable across retries, so receivers can drop duplicates
+        message.set_content(mail.body, subtype="html")
+        await self.pool.send(message)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "smtp_connects": self.pool.connects,
+            "mock": self.mock,
+        }
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+
+# Resized WebP variants of uploaded images, rendered in a process pool after upload.
+# Variants are keyed by the source file's stem (its SHA-256 for uploads), so each
+# distinct image is rendered once however many users or tasks point at it.
+
+STATIC_DIR = "app/static"
+DERIVED_DIR = os.path.join(STATIC_DIR, "derived")
+VARIANTS = {"thumb": 128, "medium": 512}
+MEDIA_KINDS = ("avatars", "proofs")
+
+def variant_path(source_path: str, variant: str) -> str:
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(DERIVED_DIR, f"{stem}_{variant}.webp")
+
+def render_variants(source_path: str) -> int:
+    """Process-pool worker: write the missing variants of `source_path`. Returns how many were written."""
+    from PIL import Image, ImageOps
+
+    todo = {v: variant_path(source_path, v) for v in VARIANTS if not os.path.exists(variant_path(source_path, v))}
+    if not todo:
+        return 0
+    os.makedirs(DERIVED_DIR, exist_ok=True)
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)  # phone photos: honour the orientation tag
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        for variant, path in todo.items():
+            size = VARIANTS[variant]
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            resized.save(tmp, "WEBP", quality=settings.IMAGE_QUALITY, method=4)
+            os.replace(tmp, path)
+    return len(todo)
+
+class ImagePipeline:
+    """
+    Fire-and-forget derivative rendering. `submit` returns immediately; the pool is
+    created on first use and requests never wait for it.
+    """
+
+    def __init__(self, workers: int = settings.IMAGE_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._inflight: Set[str] = set()
+        # source path -> (consecutive failures, monotonic time before which it isn't retried)
+        self._failures: Dict[str, Tuple[int, float]] = {}
+
+        self.submitted = 0
+        self.rendered = 0
+        self.failed = 0
+
+    def submit(self, source_path: str) -> bool:
+        if self.workers <= 0 or source_path in self._inflight:
+            return False
+        if source_path in self._failures and time.monotonic() < self._failures[source_path][1]:
+            return False
+        if all(os.path.exists(variant_path(source_path, v)) for v in VARIANTS):
+            return False
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.submitted += 1
+        self._inflight.add(source_path)
+        task = asyncio.create_task(self._render(source_path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _render(self, source_path: str):
+        loop = asyncio.get_running_loop()
+        try:
+            self.rendered += await loop.run_in_executor(self._pool, render_variants, source_path)
+            self._failures.pop(source_path, None)
+        except Exception as e:
+            self.failed += 1
+            failures = self._failures.get(source_path, (0, 0.0))[0] + 1
+            backoff = min(settings.IMAGE_RETRY_BASE_SECONDS * 2 ** (failures - 1), settings.IMAGE_RETRY_MAX_SECONDS)
+            self._failures[source_path] = (failures, time.monotonic() + backoff)
+            print(f"❌ Image variants for {source_path} failed: {e}")
+        finally:
+            self._inflight.discard(source_path)
+
+    async def stop(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._inflight),
+            "submitted": self.submitted,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "backing_off": sum(1 for _, retry_at in self._failures.values() if retry_at > time.monotonic()),
+        }
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,62 @@
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+
+# Deterministic parser for the common "quick add" phrasings.
+# Shared by POST /smart/process and Homie's fast path, returns tool calls in Homie's format.
+
+EXPENSE_PATTERNS = (
+    r'(spent|paid|buy|bought)\s+(\$?[\d\.]+)\s+(on|for)?\s*(.*)',  # "spent 50 on food"
+    r'(buy|bought)\s+(.*)\s+for\s+(\$?[\d\.]+)',  # "buy milk for 5"
+)
+TASK_TRIGGERS = ("remind", "task", "todo", "need to")
+# Strict mode (Homie chat): the message must *start* with a command, questions never match
+STRICT_TASK_PREFIXES = ("remind me to", "add task", "todo", "need to")
+HOMIE_PREFIX = re.compile(r'^\s*@?homie\b[\s,:!]*|@homie\b', re.IGNORECASE)
+
+def strip_homie(text: str) -> str:
+    """Drop the "@homie" / "homie," addressing so only the request is left."""
+    return HOMIE_PREFIX.sub(" ", text).strip()
+
+def _parse_expense(text: str, strict: bool) -> Optional[dict]:
+    match = re.match if strict else re.search
+    if not any(match(p, text) for p in EXPENSE_PATTERNS):
+        return None
+    try:
+        amount = 0
+        # Find number
+        for p in text.split():
+            if p.replace('$', '').replace('.', '').isdigit():
+                amount = float(p.replace('$', ''))
+                break
+
+        # Rough description extraction
+        desc = text.replace(str(int(amount)), "").replace("$", "").replace("spent", "").replace("paid", "").replace("on", "").replace("for", "").strip()
+    except ValueError:
+        return None
+    return {"tool": "create_expense", "args": {"description": desc.capitalize(), "amount": amount, "category": "General"}}
+
+def _parse_task(text: str, strict: bool) -> Optional[dict]:
+    # "remind me to clean tomorrow", "add task clean kitchen"
+    if strict and not text.startswith(STRICT_TASK_PREFIXES):
+        return None
+    if not any(t in text for t in TASK_TRIGGERS):
+        return None
+    task_title = text.replace("remind me to", "").replace("add task", "").replace("need to", "").strip()
+
+    args = {}
+    if "tomorrow" in task_title:
+        args["due_date"] = (datetime.utcnow() + timedelta(days=1)).isoformat()
+        task_title = task_title.replace("tomorrow", "").strip()
+    args["title"] = task_title.capitalize()
+    return {"tool": "create_task", "args": args}
+
+def parse_intent(text: str, strict: bool = False) -> Optional[dict]:
+    """
+    Return a create_expense / create_task tool call, or None if the text isn't a quick add.
+    strict=True only accepts messages that open with the command (used for free-form chat).
+    """
+    text = text.lower().strip()
+    if strict and text.endswith("?"):
+        return None
+    return _parse_expense(text, strict) or _parse_task(text, strict)
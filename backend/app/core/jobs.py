@@ -0,0 +1,92 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Set
+
+class BoundedJobQueue:
+    """
+    Runs async jobs off the caller's path with bounded concurrency.
+    - at most `max_pending` jobs queued or running (submit refuses beyond that)
+    - at most `max_concurrency` running at once
+    - at most `per_key` running at once for the same key (e.g. group)
+    - every job is cancelled after `timeout` seconds
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int, per_key: int, timeout: float, name: str = "job"):
+        self.max_pending = max_pending
+        self.per_key = per_key
+        self.timeout = timeout
+        self.name = name
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._per_key: Dict[str, asyncio.Semaphore] = {}
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.running = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(t) for t in self._tasks.values())
+
+    def submit(self, key: str, job: Callable[[], Awaitable]) -> bool:
+        """Schedule `job()` and return immediately. False if the queue is full."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        task = asyncio.create_task(self._run(key, job))
+        self._tasks.setdefault(key, set()).add(task)
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return True
+
+    def _forget(self, key: str, task: asyncio.Task):
+        tasks = self._tasks.get(key)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[key]
+                self._per_key.pop(key, None)
+
+    async def _run(self, key: str, job: Callable[[], Awaitable]):
+        semaphore = self._per_key.setdefault(key, asyncio.Semaphore(self.per_key))
+        async with semaphore, self._global:
+            self.running += 1
+            try:
+                await asyncio.wait_for(job(), self.timeout)
+                self.completed += 1
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                print(f"⏱️ {self.name} for {key} timed out after {self.timeout}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ {self.name} for {key} failed: {e}")
+            finally:
+                self.running -= 1
+
+    def cancel(self, key: str) -> int:
+        """Cancel every queued or running job for `key`."""
+        tasks = list(self._tasks.get(key, ()))
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+
+    async def stop(self):
+        tasks = [t for group in self._tasks.values() for t in group]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+        }
@@ -0,0 +1,48 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Annotated, Union
+
+from pydantic import PlainSerializer
+from pydantic.functional_validators import BeforeValidator
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+# Money is stored as integer cents and handled as 2-place Decimals in Python.
+# Floats only appear at the JSON boundary (the frontend expects plain numbers).
+
+CENT = Decimal("0.01")
+
+def to_decimal(value: Union[int, float, str, Decimal]) -> Decimal:
+    """Exact 2-place amount. Floats go through their shortest repr, so 19.99 stays 19.99."""
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+def to_cents(value: Union[int, float, str, Decimal]) -> int:
+    return int(to_decimal(value) * 100)
+
+def from_cents(cents: int) -> Decimal:
+    return (Decimal(cents) / 100).quantize(CENT)
+
+class Cents(TypeDecorator):
+    """
+    64-bit integer column of minor units, exposed to Python as a 2-place Decimal (SUM() results too).
+    A 32-bit int4 would overflow past ~21.4M in cents, which running totals reach first.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(int(value))
+
+def _parse(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+        raise ValueError("Invalid amount")
+    try:
+        return to_decimal(value)
+    except ArithmeticError:
+        raise ValueError("Invalid amount")
+
+# Request/response field: accepts 12, 12.5, "12.50"; serializes as a JSON number
+Money = Annotated[Decimal, BeforeValidator(_parse), PlainSerializer(float, return_type=float, when_used="json")]
@@ -0,0 +1,126 @@
+import asyncio
+from typing import Optional
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.chat import Message
+
+class MessagePersister:
+    """
+    Write-behind queue for chat messages.
+    Callers enqueue rows (with id and created_at already set) and move on; a single
+    background task group-commits them every few ms or every `batch_size` rows, on a
+    worker thread so the event loop never waits for the disk.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.CHAT_PERSIST_BATCH_SIZE,
+        flush_interval: float = settings.CHAT_PERSIST_INTERVAL_MS / 1000,
+        max_queue: int = settings.CHAT_PERSIST_MAX_QUEUE,
+        session_factory=SessionLocal,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.session_factory = session_factory
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Rows submitted / handled (written or failed) so far, for flush()
+        self._submitted = 0
+        self._handled = 0
+        self._progress: Optional[asyncio.Condition] = None
+
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self._progress = asyncio.Condition()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, row: dict):
+        """Enqueue one Message row. Only waits when the queue is full (back-pressure)."""
+        if self._task is None or self._task.done():
+            self.start()
+        await self.queue.put(row)
+        self._submitted += 1
+
+    async def flush(self):
+        """Wait until every row submitted before this call has been written (or has failed)."""
+        if self._task is None or self._task.done():
+            return
+        target = self._submitted
+        async with self._progress:
+            await self._progress.wait_for(lambda: self._handled >= target)
+
+    async def stop(self):
+        """Flush everything still queued, then stop the writer."""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            self.queue.put_nowait(None)  # wake the writer if idle
+        except asyncio.QueueFull:
+            pass  # a full queue means the writer isn't idle; it drains everything once stopping
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            row = await self.queue.get()
+            batch = [] if row is None else [row]
+            if not self._stopping and self.queue.qsize() < self.batch_size - 1:
+                # Group-commit window: let concurrent senders pile in
+                await asyncio.sleep(self.flush_interval)
+            while not self.queue.empty() and (self._stopping or len(batch) < self.batch_size):
+                row = self.queue.get_nowait()
+                if row is not None:
+                    batch.append(row)
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                finally:
+                    async with self._progress:
+                        self._handled += len(batch)
+                        self._progress.notify_all()
+            if self._stopping and self.queue.empty():
+                return
+
+    def _write(self, batch: list):
+        db = self.session_factory()
+        try:
+            for i in range(0, len(batch), self.batch_size):
+                db.execute(insert(Message), batch[i:i + self.batch_size])
+            db.commit()
+            self.batches += 1
+            self.written += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+        except Exception as e:
+            db.rollback()
+            self.failed += len(batch)
+            print(f"❌ Failed to persist {len(batch)} chat messages: {e}")
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": round(self.written / self.batches, 1) if self.batches else 0.0,
+        }
+
+message_persister = MessagePersister()
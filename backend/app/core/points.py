@@ -0,0 +1,87 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+from app.core.database import upsert
+from app.models.points import PointsEntry, PointsRollup
+from app.models.user import User, generate_uuid
+
+# Every points change goes through `award` / `spend`: one atomic UPDATE of the
+# materialized User.current_points, one ledger row and the week/month rollups, all in
+# the caller's transaction. Nothing here reads a balance into Python and writes it back.
+
+PERIODS = ("week", "month")
+SPENDING_REASONS = ("reward_claimed", "reward_refunded")
+
+def period_start(period: str, at: Optional[datetime] = None) -> date:
+    day = (at or datetime.utcnow()).date()
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+def _bump_rollups(db: Session, user_id: str, group_id: str, delta: int, reason: str):
+    earned, spent = (0, -delta) if reason in SPENDING_REASONS else (delta, 0)
+    now = datetime.utcnow()
+    for period in PERIODS:
+        stmt = upsert(db, PointsRollup).values(
+            user_id=user_id, group_id=group_id, period=period,
+            period_start=period_start(period, now), earned=earned, spent=spent,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "group_id", "period", "period_start"],
+            set_={"earned": PointsRollup.earned + stmt.excluded.earned, "spent": PointsRollup.spent + stmt.excluded.spent},
+        ))
+
+def _expire_balance(db: Session, user_id: str):
+    # The UPDATE bypassed the ORM; make a loaded User re-read its balance on next access
+    user = db.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        db.expire(user, ["current_points"])
+
+def _record(db: Session, user_id: str, group_id: Optional[str], delta: int, reason: str, ref_id: Optional[str]):
+    db.add(PointsEntry(user_id=user_id, group_id=group_id, delta=delta, reason=reason, ref_id=ref_id))
+    if group_id is not None:
+        _bump_rollups(db, user_id, group_id, delta, reason)
+    _expire_balance(db, user_id)
+
+def award(db: Session, user_id: str, group_id: Optional[str], points: int, reason: str, ref_id: Optional[str] = None):
+    """Add `points` (may be negative for corrections). The caller commits."""
+    if not points:
+        return
+    db.execute(update(User).where(User.id == user_id)
+               .values(current_points=User.current_points + points)
+               .execution_options(synchronize_session=False))
+    _record(db, user_id, group_id, points, reason, ref_id)
+
+def award_many(db: Session, user_id: str, group_id: Optional[str], awards: List[Tuple[int, Optional[str]]], reason: str):
+    """`award` for several (points, ref_id) at once: one balance UPDATE, one ledger insert, one rollup bump."""
+    awards = [(p, ref) for p, ref in awards if p]
+    total = sum(p for p, _ in awards)
+    if not awards:
+        return
+    db.execute(update(User).where(User.id == user_id)
+               .values(current_points=User.current_points + total)
+               .execution_options(synchronize_session=False))
+    db.execute(insert(PointsEntry), [
+        {"id": generate_uuid(), "user_id": user_id, "group_id": group_id, "delta": p, "reason": reason, "ref_id": ref}
+        for p, ref in awards
+    ])
+    if group_id is not None and total:
+        _bump_rollups(db, user_id, group_id, total, reason)
+    _expire_balance(db, user_id)
+
+def spend(db: Session, user_id: str, group_id: Optional[str], points: int, reason: str, ref_id: Optional[str] = None) -> bool:
+    """Deduct `points` only if the balance covers it (checked in the same UPDATE). False if it doesn't."""
+    result = db.execute(update(User)
+                        .where(User.id == user_id, User.current_points >= points)
+                        .values(current_points=User.current_points - points)
+                        .execution_options(synchronize_session=False))
+    if result.rowcount != 1:
+        return False
+    _record(db, user_id, group_id, -points, reason, ref_id)
+    return True
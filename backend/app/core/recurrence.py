@@ -0,0 +1,206 @@
+import asyncio
+import calendar
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.task import Task, TaskSeries, TaskStatus
+from app.models.user import generate_uuid
+
+# Recurrence rules (Task.recurrence / TaskSeries.rule):
+#   "daily"                  every day at the anchor's time
+#   "weekly"                 every week on the anchor's weekday
+#   "weekdays"               Monday to Friday
+#   "weekly:mon,wed,fri"     on the listed weekdays
+#   "monthly"                on the anchor's day of month, clamped to short months (31st -> Feb 28/29)
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+def parse_rule(rule: str, anchor: datetime) -> tuple:
+    """Normalize a rule to ("daily",) / ("monthly",) / ("days", frozenset of weekday numbers)."""
+    rule = (rule or "").strip().lower()
+    if rule in ("daily", "monthly"):
+        return (rule,)
+    if rule == "weekly":
+        return ("days", frozenset([anchor.weekday()]))
+    if rule == "weekdays":
+        return ("days", frozenset(range(5)))
+    if rule.startswith("weekly:"):
+        names = [d.strip()[:3] for d in rule[len("weekly:"):].split(",") if d.strip()]
+        if names and all(n in WEEKDAYS for n in names):
+            return ("days", frozenset(WEEKDAYS.index(n) for n in names))
+    raise ValueError(f"Unsupported recurrence rule: {rule!r}")
+
+def to_utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def add_months(anchor: datetime, months: int) -> datetime:
+    month_index = anchor.month - 1 + months
+    year, month = anchor.year + month_index // 12, month_index % 12 + 1
+    day = min(anchor.day, calendar.monthrange(year, month)[1])
+    return anchor.replace(year=year, month=month, day=day)
+
+def next_occurrence(rule: str, anchor: datetime, after: datetime) -> datetime:
+    """The first occurrence of the series strictly after `after` (never before `anchor`)."""
+    kind = parse_rule(rule, anchor)
+    if after < anchor:
+        if kind[0] != "days" or anchor.weekday() in kind[1]:
+            return anchor
+        after = anchor
+
+    if kind[0] == "daily":
+        days = (after - anchor) // timedelta(days=1) + 1
+        return anchor + timedelta(days=days)
+
+    if kind[0] == "monthly":
+        months = (after.year - anchor.year) * 12 + after.month - anchor.month
+        candidate = add_months(anchor, months)
+        return candidate if candidate > after else add_months(anchor, months + 1)
+
+    for offset in range(8):
+        candidate = datetime.combine(after.date() + timedelta(days=offset), anchor.time())
+        if candidate > after and candidate.weekday() in kind[1]:
+            return candidate
+    raise AssertionError("unreachable: a weekday set always matches within a week")
+
+def upcoming(rule: str, anchor: datetime, due: datetime, now: datetime) -> datetime:
+    """`due`, or if it has already passed, the first occurrence at or after `now` - missed ones are skipped."""
+    if due >= now:
+        return due
+    return next_occurrence(rule, anchor, now - timedelta(microseconds=1))
+
+def create_series(db: Session, task: Task, rule: str) -> TaskSeries:
+    """Turn `task` into the first occurrence of a new series (validates the rule)."""
+    anchor = to_utc_naive(task.due_date or datetime.utcnow())
+    parse_rule(rule, anchor)
+    series = TaskSeries(
+        group_id=task.group_id,
+        created_by_id=task.created_by_id,
+        assigned_to_id=task.assigned_to_id,
+        title=task.title,
+        description=task.description,
+        priority=task.priority,
+        points=task.points,
+        rule=rule,
+        anchor=anchor,
+        # A past due date only yields this task; later occurrences start from now
+        next_due_at=upcoming(rule, anchor, next_occurrence(rule, anchor, anchor), datetime.utcnow()),
+    )
+    db.add(series)
+    db.flush()
+    task.series_id = series.id
+    task.due_date = anchor
+    return series
+
+def occurrence_rows(series: TaskSeries, horizon: datetime, now: Optional[datetime] = None) -> List[dict]:
+    """Task rows for every occurrence from next_due_at (or now, if that passed) up to `horizon`; advances next_due_at."""
+    rows = []
+    due = series.next_due_at
+    if due is not None:
+        # Occurrences missed while the sweep wasn't running are skipped, not created overdue
+        due = upcoming(series.rule, series.anchor, due, now or datetime.utcnow())
+    while due is not None and due <= horizon and len(rows) < settings.RECURRENCE_MAX_PER_SERIES:
+        rows.append({
+            "id": generate_uuid(),
+            "title": series.title,
+            "description": series.description,
+            "priority": series.priority,
+            "points": series.points,
+            "status": TaskStatus.pending.value,
+            "due_date": due,
+            "recurrence": series.rule,
+            "series_id": series.id,
+            "assigned_to_id": series.assigned_to_id,
+            "created_by_id": series.created_by_id,
+            "group_id": series.group_id,
+            "needs_approval": "no",
+            "created_at": datetime.utcnow(),
+        })
+        due = next_occurrence(series.rule, series.anchor, due)
+    series.next_due_at = due
+    return rows
+
+def materialize(db: Session, series_list: List[TaskSeries], horizon: datetime, now: Optional[datetime] = None) -> int:
+    """Bulk-insert the upcoming occurrences of `series_list` in the caller's transaction."""
+    rows = [row for series in series_list for row in occurrence_rows(series, horizon, now)]
+    if rows:
+        db.execute(insert(Task), rows)
+    return len(rows)
+
+def sweep(horizon_days: int = settings.RECURRENCE_HORIZON_DAYS, batch_size: int = settings.RECURRENCE_BATCH_SIZE,
+          now: Optional[datetime] = None) -> int:
+    """
+    Materialize every series with an occurrence due within the horizon, one batch of
+    series per transaction. Only due series are read (ix_task_series_active_due), and
+    concurrent sweeps skip each other's locked rows; re-running is a no-op.
+    """
+    now = now or datetime.utcnow()
+    horizon = now + timedelta(days=horizon_days)
+    created = 0
+    while True:
+        with SessionLocal() as db:
+            batch = db.query(TaskSeries).filter(
+                TaskSeries.active == True,
+                TaskSeries.next_due_at <= horizon,
+            ).order_by(TaskSeries.next_due_at).limit(batch_size).with_for_update(skip_locked=True).all()
+            if not batch:
+                return created
+            try:
+                created += materialize(db, batch, horizon, now)
+                db.commit()
+            except IntegrityError as e:
+                # Another worker materialized the same occurrences first
+                db.rollback()
+                print(f"⚠️ Recurrence batch skipped: {e.orig}")
+                return created
+
+class RecurrenceScheduler:
+    """Runs `sweep` in a worker thread every `interval` seconds."""
+
+    def __init__(self, interval: float = settings.RECURRENCE_SWEEP_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.materialized = 0
+        self.failed = 0
+        self.last_sweep_at: Optional[datetime] = None
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.materialized += await asyncio.to_thread(sweep)
+                self.sweeps += 1
+                self.last_sweep_at = datetime.utcnow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Recurrence sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "sweeps": self.sweeps,
+            "materialized": self.materialized,
+            "failed": self.failed,
+            "last_sweep_at": str(self.last_sweep_at) if self.last_sweep_at else None,
+        }
+
+recurrence_scheduler = RecurrenceScheduler()
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from typing import Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core import balances
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.expense import Expense, ExpenseArchive, ExpenseBalance, Settlement
+
+# Settling closes the group's open epoch instead of deleting its expenses: the open rows
+# are tagged with a Settlement (which snapshots the balances), the running totals restart
+# at zero, and a background archiver later moves tagged rows to expense_archive in small
+# batches so the hot table only holds the open epoch.
+
+ARCHIVE_COLUMNS = ("id", "description", "amount", "category", "is_subscription", "billing_day",
+                   "paid_by_id", "group_id", "created_at", "settlement_id", "subscription_id", "billing_period")
+
+def settle(db: Session, group_id: str, settled_by_id: str) -> Settlement:
+    """Close the open epoch in the caller's transaction."""
+    # Concurrent expense writes take the same lock, so they wait for the reset
+    balances.lock_groups(db, [group_id])
+    snapshot = balances.compute_balances(db, group_id)
+    count = sum(n for (n,) in db.query(ExpenseBalance.expense_count).filter(ExpenseBalance.group_id == group_id))
+
+    settlement = Settlement(group_id=group_id, settled_by_id=settled_by_id, total=snapshot.get("total", 0),
+                            expense_count=count, snapshot=json.dumps(snapshot, default=float))
+    db.add(settlement)
+    db.flush()
+    db.execute(update(Expense)
+               .where(Expense.group_id == group_id, Expense.settlement_id.is_(None))
+               .values(settlement_id=settlement.id)
+               .execution_options(synchronize_session=False))
+    balances.reset_group(db, group_id)
+    return settlement
+
+def archive_settled(batch_size: int = settings.SETTLEMENT_ARCHIVE_BATCH) -> int:
+    """Move settled expenses to expense_archive, one short transaction per batch. Returns rows moved."""
+    moved = 0
+    while True:
+        with SessionLocal() as db:
+            ids = [i for (i,) in db.query(Expense.id).filter(Expense.settlement_id.isnot(None)).limit(batch_size)]
+            if not ids:
+                return moved
+            source = select(*(getattr(Expense, c) for c in ARCHIVE_COLUMNS)).where(Expense.id.in_(ids))
+            db.execute(insert(ExpenseArchive).from_select([getattr(ExpenseArchive, c) for c in ARCHIVE_COLUMNS], source))
+            db.execute(delete(Expense).where(Expense.id.in_(ids)))
+            db.commit()
+            moved += len(ids)
+
+class SettlementArchiver:
+    """Runs `archive_settled` in a worker thread after each settlement and every `interval` seconds."""
+
+    def __init__(self, interval: float = settings.SETTLEMENT_ARCHIVE_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.runs = 0
+        self.archived = 0
+        self.failed = 0
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def kick(self):
+        """Archive soon. Safe to call from the threadpool (sync endpoints) after a settlement commits."""
+        if self._loop is not None and self._task is not None and not self._task.done():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.archived += await asyncio.to_thread(archive_settled)
+                self.runs += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Expense archiving failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "archived": self.archived, "failed": self.failed}
+
+settlement_archiver = SettlementArchiver()
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+
+# Image uploads (avatars, task proofs).
+# Files are read in chunks, sniffed by their magic bytes, hashed and written in the
+# same pass on a worker thread, and stored under their SHA-256, so re-uploading the
+# same photo reuses the existing file.
+
+CHUNK_SIZE = 1024 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # boundaries and part headers around the file
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """File extension for a JPEG/PNG/GIF/WebP header, None for anything else."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+class StoredUpload:
+    __slots__ = ("filename", "path", "sha256", "size", "content_type", "deduplicated")
+
+    def __init__(self, filename: str, path: str, sha256: str, size: int, content_type: str, deduplicated: bool):
+        self.filename = filename
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.content_type = content_type
+        self.deduplicated = deduplicated
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large (max {max_bytes // (1024 * 1024)} MB)")
+
+def _open_temp(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-", delete=False)
+
+def _write_chunk(out, hasher, chunk: bytes):
+    hasher.update(chunk)
+    out.write(chunk)
+
+def _commit(out, directory: str, filename: str) -> bool:
+    """Move the temp file into place. True if an identical file was already stored."""
+    out.close()
+    path = os.path.join(directory, filename)
+    if os.path.exists(path):
+        os.remove(out.name)
+        return True
+    os.replace(out.name, path)
+    return False
+
+def _discard(out):
+    out.close()
+    try:
+        os.remove(out.name)
+    except FileNotFoundError:
+        pass
+
+async def store_image(file: UploadFile, directory: str, max_bytes: int = settings.UPLOAD_MAX_BYTES) -> StoredUpload:
+    """
+    Stream `file` into `directory` as <sha256>.<ext>. Raises 400 for non-images and
+    413 as soon as more than `max_bytes` have been read. The event loop only awaits.
+    """
+    head = await file.read(CHUNK_SIZE)
+    ext = sniff_image(head)
+    if ext is None:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+
+    hasher = hashlib.sha256()
+    out = await asyncio.to_thread(_open_temp, directory)
+    size = 0
+    try:
+        chunk = head
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            await asyncio.to_thread(_write_chunk, out, hasher, chunk)
+            chunk = await file.read(CHUNK_SIZE)
+        filename = f"{hasher.hexdigest()}.{ext}"
+        deduplicated = await asyncio.to_thread(_commit, out, directory, filename)
+    except BaseException:
+        await asyncio.to_thread(_discard, out)
+        raise
+
+    content_type = "image/jpeg" if ext == "jpg" else f"image/{ext}"
+    return StoredUpload(filename, os.path.join(directory, filename), hasher.hexdigest(), size, content_type, deduplicated)
+
+class UploadLimitMiddleware:
+    """
+    Caps multipart request bodies while they stream in, so an oversized upload is
+    refused (413) after its limit instead of being spooled to disk in full first.
+    CSV imports (paths ending in /import) get their own, larger limit; everything
+    else is an image upload.
+    """
+
+    def __init__(self, app, max_bytes: int = settings.UPLOAD_MAX_BYTES,
+                 import_max_bytes: int = settings.CSV_IMPORT_MAX_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.import_max_bytes = import_max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        max_bytes = self.import_max_bytes if scope["path"].rstrip("/").endswith("/import") else self.max_bytes
+        max_body = max_bytes + MULTIPART_OVERHEAD
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body:
+            return await self._reject(send, max_bytes)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    raise _too_large(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send, max_bytes: int):
+        body = b'{"detail":"File too large (max %d MB)"}' % (max_bytes // (1024 * 1024))
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,7 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.database import engine, Base
-from app.api.v1 import auth, tasks, groups, expenses, chat, rewards, achievements, pantry, smart
+from app.core.uploads import UploadLimitMiddleware
+from app.api.v1 import auth, tasks, groups, expenses, chat, rewards, achievements, pantry, smart, media
 
 # Create Tables
 Base.metadata.create_all(bind=engine)
@@ -28,12 +29,16 @@ origins = [
 print("Allowed Origins:", origins)
 
 
+# Refuse oversized uploads while they stream in (added first so CORS headers still wrap the 413)
+app.add_middleware(UploadLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
@@ -45,6 +50,7 @@ app.include_router(rewards.router, prefix="/api/v1/rewards", tags=["rewards"])
 app.include_router(achievements.router, prefix="/api/v1/achievements", tags=["achievements"])
 app.include_router(pantry.router, prefix="/api/v1/pantry", tags=["pantry"])
 app.include_router(smart.router, prefix="/api/v1/smart", tags=["smart"])
+app.include_router(media.router, prefix="/api/v1/media", tags=["media"])
 
 from fastapi.staticfiles import StaticFiles
 import os
@@ -62,3 +68,47 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+from app.core.deps import user_cache, membership_cache
+from app.core.persister import message_persister
+from app.core.ai import resolver_stats
+from app.core.recurrence import recurrence_scheduler
+from app.core.images import image_pipeline
+from app.core.settlements import settlement_archiver
+from app.core.billing import billing_scheduler
+from app.core.email import outbox_worker
+
+@app.on_event("startup")
+async def startup():
+    message_persister.start()
+    recurrence_scheduler.start()
+    settlement_archiver.start()
+    billing_scheduler.start()
+    outbox_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await chat.ai_jobs.stop()
+    await recurrence_scheduler.stop()
+    await settlement_archiver.stop()
+    await billing_scheduler.stop()
+    await outbox_worker.stop()
+    await image_pipeline.stop()
+    await message_persister.stop()
+    await chat.manager.broker.close()
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "user_cache": user_cache.stats(),
+        "membership_cache": membership_cache.stats(),
+        "chat": chat.manager.stats(),
+        "chat_persister": message_persister.stats(),
+        "ai_jobs": chat.ai_jobs.stats(),
+        "ai_resolver": resolver_stats(),
+        "recurrence": recurrence_scheduler.stats(),
+        "images": image_pipeline.stats(),
+        "settlement_archiver": settlement_archiver.stats(),
+        "billing": billing_scheduler.stats(),
+        "email_outbox": outbox_worker.stats(),
+    }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -18,3 +18,8 @@ class Message(Base):
     # Relationships
     sender = relationship("User", foreign_keys=[sender_id])
     group = relationship("Group", foreign_keys=[group_id])
+
+    __table_args__ = (
+        # History pages: WHERE group_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_messages_group_created", "group_id", "created_at", "id"),
+    )
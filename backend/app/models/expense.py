@@ -1,15 +1,16 @@
-from sqlalchemy import Column, String, Integer, Float, ForeignKey, DateTime, Boolean, Enum
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, DateTime, Date, Boolean, Enum, Index, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 from app.models.user import generate_uuid
+from app.core.money import Cents
 
 class Expense(Base):
     __tablename__ = "expenses"
 
     id = Column(String, primary_key=True, default=generate_uuid)
     description = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column("amount_cents", Cents, nullable=False)  # Decimal in Python, integer cents in the DB
     category = Column(String, nullable=False) # e.g. Grocery, Rent
     
     # Subscription Tracking
@@ -21,6 +22,101 @@ class Expense(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Set when a settlement closes this expense's epoch; the archiver then moves it to expense_archive
+    settlement_id = Column(String, ForeignKey("settlements.id"), nullable=True)
+
+    # Charges of a subscription: one per billing period (1st of the month), see app.core.billing
+    subscription_id = Column(String, ForeignKey("subscriptions.id"), nullable=True)
+    billing_period = Column(Date, nullable=True)
+
     # Relationships
     payer = relationship("User", foreign_keys=[paid_by_id])
     group = relationship("Group", foreign_keys=[group_id])
+
+    __table_args__ = (
+        # Open epoch: WHERE group_id = ? AND settlement_id IS NULL
+        Index("ix_expenses_group_settlement", "group_id", "settlement_id"),
+        # Archiver: WHERE settlement_id IS NOT NULL
+        Index("ix_expenses_settlement", "settlement_id"),
+        # A subscription is charged at most once per period
+        Index("ux_expenses_subscription_period", "subscription_id", "billing_period", unique=True),
+    )
+
+class Subscription(Base):
+    """A recurring bill: charged as a new expense on `billing_day` of every month (the last day in shorter months)."""
+    __tablename__ = "subscriptions"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    group_id = Column(String, ForeignKey("groups.id"), nullable=False)
+    paid_by_id = Column(String, ForeignKey("users.id"), nullable=False)
+    description = Column(String, nullable=False)
+    amount = Column("amount_cents", Cents, nullable=False)
+    category = Column(String, nullable=False)
+    billing_day = Column(Integer, nullable=False)  # 1-31
+    active = Column(Boolean, default=True, nullable=False)
+    last_billed_period = Column(Date, nullable=True)  # 1st of the last month charged
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Billing run: WHERE billing_day <= ? ... ORDER BY billing_day, group_id
+        Index("ix_subscriptions_billing_day_group", "billing_day", "group_id"),
+    )
+
+class Settlement(Base):
+    """A settle-up: closes the group's open expenses and snapshots who paid what and who owed whom."""
+    __tablename__ = "settlements"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    group_id = Column(String, ForeignKey("groups.id"), nullable=False)
+    settled_by_id = Column(String, ForeignKey("users.id"), nullable=False)
+    total = Column("total_cents", Cents, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
+    snapshot = Column(Text, nullable=True)  # JSON: paid per user and the suggested transfers
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_settlements_group_created", "group_id", "created_at"),
+    )
+
+class ExpenseArchive(Base):
+    """Settled expenses, moved out of the hot `expenses` table in the background."""
+    __tablename__ = "expense_archive"
+
+    id = Column(String, primary_key=True)
+    description = Column(String, nullable=False)
+    amount = Column("amount_cents", Cents, nullable=False)
+    category = Column(String, nullable=False)
+    is_subscription = Column(Boolean, default=False)
+    billing_day = Column(Integer, nullable=True)
+    paid_by_id = Column(String, ForeignKey("users.id"), nullable=False)
+    group_id = Column(String, ForeignKey("groups.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    settlement_id = Column(String, ForeignKey("settlements.id"), nullable=False)
+    subscription_id = Column(String, ForeignKey("subscriptions.id"), nullable=True)
+    billing_period = Column(Date, nullable=True)
+
+    __table_args__ = (
+        Index("ix_expense_archive_settlement", "settlement_id"),
+        Index("ix_expense_archive_group_created", "group_id", "created_at"),
+    )
+
+class ExpenseBalance(Base):
+    """Running total paid per group member, kept in step with `expenses` (see app.core.balances)."""
+    __tablename__ = "expense_balances"
+
+    group_id = Column(String, ForeignKey("groups.id"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    paid = Column("paid_cents", Cents, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
+
+class ExpenseRollup(Base):
+    """Spending per group, month, category, payer and kind, bumped with every expense write (see app.core.analytics)."""
+    __tablename__ = "expense_rollups"
+
+    group_id = Column(String, ForeignKey("groups.id"), primary_key=True)
+    month = Column(Date, primary_key=True)  # 1st of the month (UTC)
+    category = Column(String, primary_key=True)
+    paid_by_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    is_subscription = Column(Boolean, primary_key=True)
+    total = Column("total_cents", Cents, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+from app.models.user import generate_uuid
+
+class OutboxEmail(Base):
+    """An email waiting to be sent (or already sent) by the outbox worker, see app.core.email."""
+    __tablename__ = "email_outbox"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    dedupe_key = Column(String, nullable=True, unique=True)  # the same key is only ever queued once
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)  # naive UTC; a lease while sending
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Worker: WHERE status IN ('pending', 'sending') AND next_attempt_at <= now ORDER BY next_attempt_at
+        Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Date, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+from app.models.user import generate_uuid
+
+class PointsEntry(Base):
+    """Append-only history of every change to User.current_points."""
+    __tablename__ = "points_ledger"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    group_id = Column(String, ForeignKey("groups.id"), nullable=True)
+    delta = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)  # task_completed, task_approved, reward_claimed, reward_refunded, opening_balance
+    ref_id = Column(String, nullable=True)  # task / redemption id
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_points_ledger_user_created", "user_id", "created_at"),
+    )
+
+class PointsRollup(Base):
+    """Per user, group and calendar week/month totals, bumped in the same transaction as each ledger entry."""
+    __tablename__ = "points_rollups"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    group_id = Column(String, ForeignKey("groups.id"), primary_key=True)
+    period = Column(String, primary_key=True)  # week, month
+    period_start = Column(Date, primary_key=True)  # Monday / 1st of the month
+    earned = Column(Integer, nullable=False, default=0)
+    spent = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Windowed leaderboards: WHERE group_id = ? AND period = ? AND period_start = ? ORDER BY earned DESC
+        Index("ix_points_rollups_board", "group_id", "period", "period_start", "earned"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Boolean, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -31,7 +31,8 @@ class Task(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     due_date = Column(DateTime(timezone=True), nullable=True)
-    recurrence = Column(String, nullable=True) # daily, weekly, monthly
+    recurrence = Column(String, nullable=True) # see app.core.recurrence for the rule syntax
+    series_id = Column(String, ForeignKey("task_series.id"), nullable=True)
     
     # Photo Proof System
     proof_photo_url = Column(String, nullable=True)
@@ -43,3 +44,42 @@ class Task(Base):
     creator = relationship("User", foreign_keys=[created_by_id])
     approver = relationship("User", foreign_keys=[approved_by_id])
 
+    __table_args__ = (
+        # GET /tasks pages: WHERE group_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_tasks_group_created", "group_id", "created_at", "id"),
+        # Status / due-date filters (open chores, calendar ranges)
+        Index("ix_tasks_group_status_due", "group_id", "status", "due_date"),
+        Index("ix_tasks_group_assignee_status", "group_id", "assigned_to_id", "status"),
+        # Pending approvals
+        Index("ix_tasks_group_approval", "group_id", "needs_approval"),
+        # One task per occurrence: makes materialization idempotent
+        Index("ux_tasks_series_due", "series_id", "due_date", unique=True),
+    )
+
+class TaskSeries(Base):
+    """
+    A recurring chore. The recurrence sweep copies it into one Task per occurrence,
+    up to a horizon ahead; `next_due_at` is the first occurrence not yet materialized.
+    """
+    __tablename__ = "task_series"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    group_id = Column(String, ForeignKey("groups.id"), nullable=False, index=True)
+    created_by_id = Column(String, ForeignKey("users.id"), nullable=False)
+    assigned_to_id = Column(String, ForeignKey("users.id"), nullable=True)
+
+    title = Column(String, nullable=False)
+    description = Column(String, nullable=True)
+    priority = Column(String, default=TaskPriority.medium)
+    points = Column(Integer, default=10)
+
+    rule = Column(String, nullable=False)
+    anchor = Column(DateTime, nullable=False)  # first occurrence, UTC; fixes time of day / day of month
+    next_due_at = Column(DateTime, nullable=True)  # None once the series has ended
+    active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Sweep: WHERE active AND next_due_at <= horizon ORDER BY next_due_at
+        Index("ix_task_series_active_due", "active", "next_due_at"),
+    )
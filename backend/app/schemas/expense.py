@@ -1,15 +1,22 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import date, datetime
+from app.core.money import Money
 
 class ExpenseBase(BaseModel):
     description: str
-    amount: float
+    amount: Money
     category: str
 
 class ExpenseCreate(ExpenseBase):
     is_subscription: bool = False
-    billing_day: Optional[int] = None
+    billing_day: Optional[int] = Field(None, ge=1, le=31)
+
+class ExpenseImportRow(ExpenseBase):
+    """One CSV row of POST /expenses/import (columns as in the export; unknown ones are ignored)."""
+    category: str = "General"
+    date: Optional[datetime] = None  # defaults to now
+    paid_by_email: Optional[str] = None  # a group member; defaults to the importer
 
 class ExpenseResponse(ExpenseBase):
     id: str
@@ -24,3 +31,52 @@ class ExpenseResponse(ExpenseBase):
 
     class Config:
         from_attributes = True
+
+class ExpenseTotal(BaseModel):
+    key: str
+    name: Optional[str] = None
+    total: Money
+    count: int
+
+class ExpenseSummary(BaseModel):
+    total: Money
+    count: int
+    by_payer: List[ExpenseTotal]
+    by_category: List[ExpenseTotal]
+
+class MonthTotal(BaseModel):
+    month: date  # 1st of the month
+    total: Money
+    subscription: Money
+    one_off: Money
+    count: int
+
+class ExpenseAnalytics(BaseModel):
+    since: date
+    total: Money
+    subscription: Money
+    one_off: Money
+    count: int
+    by_month: List[MonthTotal]
+    by_category: List[ExpenseTotal]
+    by_payer: List[ExpenseTotal]
+
+class SubscriptionResponse(ExpenseBase):
+    id: str
+    group_id: str
+    paid_by_id: str
+    billing_day: int
+    active: bool
+    last_billed_period: Optional[date] = None
+
+    class Config:
+        from_attributes = True
+
+class SettlementResponse(BaseModel):
+    id: str
+    group_id: str
+    settled_by_id: str
+    total: Money
+    expense_count: int
+    created_at: datetime
+    snapshot: Optional[dict] = None  # balances at the time of settling (paid, transfers)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import date
 
 class GroupBase(BaseModel):
     name: str
@@ -24,3 +25,12 @@ class GroupMemberResponse(BaseModel):
     avatar_url: Optional[str] = None
     role: str
     points: int = 0
+
+class PointsPeriod(BaseModel):
+    period: str
+    period_start: date
+    earned: int = 0
+    spent: int = 0
+
+    class Config:
+        from_attributes = True
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from datetime import datetime
 from app.models.task import TaskPriority, TaskStatus
 
@@ -15,6 +15,11 @@ class TaskBase(BaseModel):
 class TaskCreate(TaskBase):
     pass
 
+class TaskImportRow(TaskBase):
+    """One CSV row of POST /tasks/import (columns as in the export; unknown ones are ignored)."""
+    status: TaskStatus = TaskStatus.pending
+    assigned_to_email: Optional[str] = None
+
 class TaskUpdate(TaskBase):
     status: Optional[TaskStatus] = None
 
@@ -26,6 +31,24 @@ class TaskResponse(TaskBase):
     proof_photo_url: Optional[str] = None
     needs_approval: Optional[str] = "no"
     approved_by_id: Optional[str] = None
+    series_id: Optional[str] = None
 
     class Config:
         from_attributes = True
+
+class TaskOperation(BaseModel):
+    op: Literal["create", "status", "assign", "delete"]
+    task_id: Optional[str] = None  # status / assign / delete
+    status: Optional[TaskStatus] = None  # status
+    assigned_to_id: Optional[str] = None  # assign (None unassigns)
+    task: Optional[TaskCreate] = None  # create
+
+class TaskBatch(BaseModel):
+    operations: List[TaskOperation] = Field(..., max_length=500)
+
+class TaskOperationResult(BaseModel):
+    index: int
+    op: str
+    ok: bool
+    task_id: Optional[str] = None
+    error: Optional[str] = None
@@ -0,0 +1,128 @@
+"""
+Schema upgrade for existing databases (SQLite or PostgreSQL).
+create_all() only creates missing tables, so columns and indexes added to
+existing models are created here. Safe to run repeatedly.
+"""
+
+from sqlalchemy import BigInteger, inspect, text
+
+from app.core.database import engine, Base, SessionLocal
+from app.models import user, task, expense, chat, reward, achievement, pantry, points, outbox  # noqa: F401 (register models)
+
+def add_missing_columns():
+    # New columns on existing tables are nullable, so a plain ADD COLUMN is enough
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"Added {table.name}.{column.name}")
+
+def migrate_money_to_cents():
+    # expenses.amount (float dollars) -> expenses.amount_cents (integer), converted exactly
+    from app.core.money import to_cents
+    inspector = inspect(engine)
+    if "amount" in {c["name"] for c in inspector.get_columns("expenses")}:
+        with engine.begin() as conn:
+            rows = conn.execute(text("SELECT id, amount FROM expenses WHERE amount_cents IS NULL")).all()
+            if rows:
+                conn.execute(text("UPDATE expenses SET amount_cents = :cents WHERE id = :id"),
+                             [{"id": row.id, "cents": to_cents(row.amount or 0)} for row in rows])
+            conn.execute(text("ALTER TABLE expenses DROP COLUMN amount"))
+        print(f"Converted {len(rows)} expense amounts to cents")
+    # expense_balances is derived data: recreate it in cents, rebuild_expense_balances refills it
+    if inspector.has_table("expense_balances") and "paid" in {c["name"] for c in inspector.get_columns("expense_balances")}:
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE expense_balances"))
+        Base.metadata.create_all(bind=engine)
+
+def widen_cents_columns():
+    # Cents columns created as 32-bit INTEGER on PostgreSQL -> BIGINT (SQLite integers are already 64-bit)
+    from app.core.money import Cents
+    if engine.dialect.name != "postgresql":
+        return
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            types = {c["name"]: c["type"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if isinstance(column.type, Cents) and column.name in types and not isinstance(types[column.name], BigInteger):
+                    conn.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE BIGINT'))
+                    print(f"Widened {table.name}.{column.name} to BIGINT")
+
+def create_missing_indexes():
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    print("Created missing indexes")
+
+def backfill_points_ledger():
+    # Balances from before the ledger existed become one opening_balance entry each
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            INSERT INTO points_ledger (id, user_id, group_id, delta, reason, created_at)
+            SELECT u.id, u.id, NULL, u.current_points, 'opening_balance', CURRENT_TIMESTAMP
+            FROM users u
+            WHERE u.current_points != 0
+              AND NOT EXISTS (SELECT 1 FROM points_ledger l WHERE l.user_id = u.id)
+        """))
+        print(f"Opened points ledger for {result.rowcount} users")
+
+def rebuild_expense_balances():
+    # Running totals for expenses recorded before expense_balances existed (and any drift since)
+    from app.core.balances import check_consistency
+    with SessionLocal() as db:
+        drift = check_consistency(db, repair=True)
+        db.commit()
+    print(f"Rebuilt {len(drift)} expense balances")
+
+def rebuild_expense_rollups():
+    # Analytics buckets for expenses recorded before expense_rollups existed
+    from app.core.analytics import rebuild
+    with SessionLocal() as db:
+        buckets = rebuild(db)
+        db.commit()
+    print(f"Rebuilt {buckets} expense rollup buckets")
+
+def backfill_subscriptions():
+    # Subscription expenses from before the billing run existed become subscriptions,
+    # billed through the month they were entered in
+    from app.core.points import period_start
+    from app.models.expense import Expense, Subscription
+    with SessionLocal() as db:
+        legacy = db.query(Expense).filter(Expense.is_subscription == True, Expense.billing_day.isnot(None),
+                                          Expense.subscription_id.is_(None)).all()
+        for expense in legacy:
+            period = period_start("month", expense.created_at)
+            subscription = Subscription(
+                group_id=expense.group_id, paid_by_id=expense.paid_by_id, description=expense.description,
+                amount=expense.amount, category=expense.category, billing_day=expense.billing_day,
+                last_billed_period=period,
+            )
+            db.add(subscription)
+            db.flush()
+            expense.subscription_id, expense.billing_period = subscription.id, period
+        db.commit()
+    print(f"Created {len(legacy)} subscriptions")
+
+def fix_db_v4():
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    migrate_money_to_cents()
+    widen_cents_columns()
+    create_missing_indexes()
+    backfill_points_ledger()
+    rebuild_expense_balances()
+    rebuild_expense_rollups()
+    backfill_subscriptions()
+
+if __name__ == "__main__":
+    fix_db_v4()
@@ -0,0 +1,118 @@
+"""
+Broker pub/sub and cross-worker fan-out, run against both implementations.
+Redis is stood in for by fakeredis; two brokers on one fake server are two workers.
+
+    cd backend && python -m pytest -q
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from app.api.v1.chat import ConnectionManager
+from app.core.broker import InMemoryBroker, RedisBroker
+
+def in_memory_pair():
+    # Workers sharing one in-process broker
+    broker = InMemoryBroker()
+    return broker, broker
+
+def redis_pair():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    return tuple(
+        RedisBroker("redis://fake", client=fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+        for _ in range(2)
+    )
+
+BROKERS = [pytest.param(in_memory_pair, id="memory"), pytest.param(redis_pair, id="redis")]
+
+async def settle(condition, timeout: float = 2.0):
+    """Wait until `condition()` holds; the Redis reader delivers asynchronously."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+
+async def close(*brokers):
+    for broker in set(brokers):
+        await broker.close()
+
+@pytest.mark.parametrize("make_pair", BROKERS)
+def test_publish_reaches_subscribers_on_both_workers(make_pair):
+    async def scenario():
+        first, second = make_pair()
+        received = {"first": [], "second": []}
+
+        async def on_first(channel, payload):
+            received["first"].append((channel, payload))
+
+        async def on_second(channel, payload):
+            received["second"].append((channel, payload))
+
+        await first.subscribe("chat:g", on_first)
+        await second.subscribe("chat:g", on_second)
+        await first.publish("chat:g", "hello")
+        await settle(lambda: received["first"] and received["second"])
+        await close(first, second)
+        return received
+
+    received = asyncio.run(scenario())
+    assert received == {"first": [("chat:g", "hello")], "second": [("chat:g", "hello")]}
+
+@pytest.mark.parametrize("make_pair", BROKERS)
+def test_unsubscribe_stops_delivery_for_that_handler_only(make_pair):
+    async def scenario():
+        first, second = make_pair()
+        received = {"first": [], "second": []}
+
+        async def on_first(channel, payload):
+            received["first"].append(payload)
+
+        async def on_second(channel, payload):
+            received["second"].append(payload)
+
+        await first.subscribe("chat:g", on_first)
+        await second.subscribe("chat:g", on_second)
+        await second.unsubscribe("chat:g", on_second)
+        await second.publish("chat:g", "after")
+        await settle(lambda: received["first"])
+        await asyncio.sleep(0.05)  # give a stray delivery the chance to show up
+        await close(first, second)
+        return received
+
+    received = asyncio.run(scenario())
+    assert received == {"first": ["after"], "second": []}
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code: int = None):
+        pass
+
+@pytest.mark.parametrize("make_pair", BROKERS)
+def test_broadcast_fans_out_across_connection_managers(make_pair):
+    async def scenario():
+        first, second = make_pair()
+        managers = [ConnectionManager(broker=first), ConnectionManager(broker=second)]
+        sockets = [FakeSocket(), FakeSocket()]
+        for manager, socket in zip(managers, sockets):
+            connection = await manager.connect(socket, "g")
+            await connection.replay([])
+        await managers[0].broadcast({"id": "m1", "content": "hi"}, "g")
+        await settle(lambda: all(s.sent for s in sockets))
+        for manager, socket in zip(managers, sockets):
+            await manager.disconnect(socket, "g")
+        await close(first, second)
+        return sockets
+
+    sockets = asyncio.run(scenario())
+    assert [s.sent for s in sockets] == [[{"id": "m1", "content": "hi"}]] * 2
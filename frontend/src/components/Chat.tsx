@@ -7,10 +7,12 @@ import { motion, AnimatePresence } from 'framer-motion';
 
 
 interface Message {
+    id?: string;
     content: string;
     sender_id: string;
     sender_name: string;
     created_at: string;
+    stream_id?: string;
 }
 
 interface ChatProps {
@@ -68,7 +70,43 @@ export default function Chat({ groupId, onClose }: ChatProps) {
             socket.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
-                    if (!Array.isArray(data)) {
+                    if (data.type === "homie_chunk") {
+                        // Streaming Homie reply: grow the placeholder bubble for this stream
+                        setMessages((prev) => {
+                            const idx = prev.findIndex(m => m.stream_id === data.stream_id);
+                            if (idx === -1) {
+                                return [...prev, {
+                                    content: data.delta,
+                                    sender_id: data.sender_id,
+                                    sender_name: data.sender_name,
+                                    created_at: new Date().toISOString(),
+                                    stream_id: data.stream_id
+                                }];
+                            }
+                            const next = [...prev];
+                            next[idx] = { ...next[idx], content: next[idx].content + data.delta };
+                            return next;
+                        });
+                        setIsTyping(false);
+                    } else if (data.type === "homie_final" && data.stream_id) {
+                        // Swap the streamed placeholder for the persisted message
+                        setMessages((prev) => {
+                            const idx = prev.findIndex(m => m.stream_id === data.stream_id);
+                            if (idx === -1) {
+                                // Replayed on reconnect: same duplicate check as regular messages
+                                const isDuplicate = prev.some(m =>
+                                    m.content === data.content &&
+                                    m.sender_id === data.sender_id &&
+                                    m.created_at === data.created_at
+                                );
+                                return isDuplicate ? prev : [...prev, data];
+                            }
+                            const next = [...prev];
+                            next[idx] = data;
+                            return next;
+                        });
+                        setIsTyping(false);
+                    } else if (!Array.isArray(data)) {
                         setMessages((prev) => {
                             const isDuplicate = prev.some(m =>
                                 m.content === data.content &&
@@ -1,30 +1,47 @@
-import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts';
+import { useEffect, useState } from 'react';
+import axios from 'axios';
+import API_URL from '../config';
+import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, PieChart, Pie, Cell, Legend } from 'recharts';
+
+interface MonthTotal {
+    month: string;
+    total: number;
+    subscription: number;
+    one_off: number;
+    count: number;
+}
+
+interface Analytics {
+    by_month: MonthTotal[];
+    by_category: { key: string, total: number, count: number }[];
+}
 
 interface FinanceAnalyticsProps {
-    expenses: any[];
+    refreshKey?: unknown; // refetch when this changes (e.g. after adding an expense)
 }
 
-export default function FinanceAnalytics({ expenses }: FinanceAnalyticsProps) {
-    // 1. Calculate Category Totals
-    const categoryTotals: Record<string, number> = {};
-    expenses.forEach(e => {
-        categoryTotals[e.category] = (categoryTotals[e.category] || 0) + e.amount;
-    });
+export default function FinanceAnalytics({ refreshKey }: FinanceAnalyticsProps) {
+    // Totals come pre-aggregated from the server (GET /expenses/analytics)
+    const [analytics, setAnalytics] = useState<Analytics>({ by_month: [], by_category: [] });
+
+    useEffect(() => {
+        axios.get(API_URL + "/api/v1/expenses/analytics", { params: { months: 6 } })
+            .then(res => setAnalytics(res.data))
+            .catch(err => console.error(err));
+    }, [refreshKey]);
 
-    const pieData = Object.keys(categoryTotals).map(cat => ({
-        name: cat,
-        value: categoryTotals[cat]
+    const pieData = analytics.by_category.map(c => ({
+        name: c.key,
+        value: c.total
     }));
 
     const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#A29AFF'];
 
-    // 2. Spending Trends (Mocking Monthly Data for now as we don't have historical dates)
-    const barData = [
-        { name: 'Week 1', amount: expenses.slice(0, 2).reduce((acc, e) => acc + e.amount, 0) || 50 },
-        { name: 'Week 2', amount: expenses.slice(2, 5).reduce((acc, e) => acc + e.amount, 0) || 120 },
-        { name: 'Week 3', amount: expenses.slice(5).reduce((acc, e) => acc + e.amount, 0) || 80 },
-        { name: 'Week 4', amount: 45 },
-    ];
+    const barData = analytics.by_month.map(m => ({
+        name: new Date(m.month + "T00:00:00").toLocaleString(undefined, { month: 'short' }),
+        subscriptions: m.subscription,
+        "one-off": m.one_off,
+    }));
 
     return (
         <div className="grid grid-cols-1 md:grid-cols-2 gap-6 mb-8">
@@ -54,7 +71,7 @@ export default function FinanceAnalytics({ expenses }: FinanceAnalyticsProps) {
             </div>
 
             <div className="bg-white p-4 rounded-2xl border-2 border-brand-dark shadow-[4px_4px_0px_0px_rgba(0,0,0,1)]">
-                <h3 className="font-black text-lg mb-4 text-center">📈 Weekly Trends</h3>
+                <h3 className="font-black text-lg mb-4 text-center">📈 Monthly Trends</h3>
                 <div className="h-64">
                     <ResponsiveContainer width="100%" height="100%">
                         <BarChart data={barData}>
@@ -62,7 +79,9 @@ export default function FinanceAnalytics({ expenses }: FinanceAnalyticsProps) {
                             <XAxis dataKey="name" />
                             <YAxis />
                             <Tooltip />
-                            <Bar dataKey="amount" fill="#FD7e14" radius={[4, 4, 0, 0]} />
+                            <Legend />
+                            <Bar dataKey="one-off" stackId="spend" fill="#FD7e14" />
+                            <Bar dataKey="subscriptions" stackId="spend" fill="#A29AFF" radius={[4, 4, 0, 0]} />
                         </BarChart>
                     </ResponsiveContainer>
                 </div>
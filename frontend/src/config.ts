@@ -1,3 +1,7 @@
 const API_URL = import.meta.env.VITE_API_BASE_URL || (import.meta.env.MODE === 'development' ? 'http://localhost:8000' : 'https://home-friends-platform.onrender.com');
 
+// Uploaded images (served from /api/v1/media) have resized variants; other URLs are returned unchanged
+export const imageVariant = (url: string | null | undefined, size: 'thumb' | 'medium') =>
+    url && url.includes('/api/v1/media/') ? `${url.split('?')[0]}?size=${size}` : url || undefined;
+
 export default API_URL;
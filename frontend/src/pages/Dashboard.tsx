@@ -1,6 +1,6 @@
 import { useState, useEffect } from "react";
 import axios from "axios";
-import API_URL from "../config";
+import API_URL, { imageVariant } from "../config";
 import { useAuthStore } from "../store/authStore";
 import { motion, AnimatePresence } from "framer-motion";
 import { Copy, LogOut, Trash2, DollarSign, CheckCircle, XCircle, Plus } from "lucide-react";
@@ -393,7 +393,7 @@ export default function Dashboard() {
     }
 
     const handleSettle = async () => {
-        if (!window.confirm("This will delete all current expenses. Everyone settled up?")) return;
+        if (!window.confirm("This closes out all current expenses (they stay in the settlement history). Everyone settled up?")) return;
         try {
             await axios.post(API_URL + "/api/v1/expenses/settle");
             fetchBalances(); // close or refresh
@@ -563,7 +563,7 @@ export default function Dashboard() {
                             <div key={task.id} className="bg-white p-4 rounded-xl border-2 border-brand-dark">
                                 <h4 className="font-bold mb-2">{task.title}</h4>
                                 {task.proof_photo_url && (
-                                    <img src={task.proof_photo_url} alt="Proof" className="w-full h-48 object-cover rounded-lg mb-3 border-2 border-gray-200" />
+                                    <img src={imageVariant(task.proof_photo_url, "medium")} alt="Proof" className="w-full h-48 object-cover rounded-lg mb-3 border-2 border-gray-200" />
                                 )}
                                 <div className="flex gap-2">
                                     <button
@@ -954,7 +954,7 @@ export default function Dashboard() {
                                 <div key={member.user_id} className="flex items-center justify-between py-2 border-b border-gray-100 last:border-0">
                                     <div className="flex items-center gap-3">
                                         <span className={`font-black w-6 text-center ${idx === 0 ? 'text-2xl' : ''}`}>{idx === 0 ? '🥇' : idx === 1 ? '🥈' : idx === 2 ? '🥉' : idx + 1}</span>
-                                        <img src={member.avatar_url || `https://api.dicebear.com/7.x/avataaars/svg?seed=${member.user_id}`} className="w-8 h-8 rounded-full border border-gray-300 items-center justify-center bg-gray-100" />
+                                        <img src={imageVariant(member.avatar_url, "thumb") || `https://api.dicebear.com/7.x/avataaars/svg?seed=${member.user_id}`} className="w-8 h-8 rounded-full border border-gray-300 items-center justify-center bg-gray-100" />
                                         <span className="font-bold text-sm truncate max-w-[100px]">{member.full_name}</span>
                                     </div>
                                     <span className="font-black text-brand-primary">{member.points} pts</span>
@@ -974,7 +974,7 @@ export default function Dashboard() {
                         </div>
 
                         <div className="space-y-4">
-                            <FinanceAnalytics expenses={expenses} />
+                            <FinanceAnalytics refreshKey={expenses} />
 
                             {/* Upcoming Subscriptions */}
                             {expenses.some(e => e.is_subscription) && (
@@ -48,8 +48,10 @@ export default function Profile() {
                     }
 
                     // Fetch completed tasks count
-                    const tasksRes = await axios.get(API_URL + "/api/v1/tasks/");
-                    const completedCount = tasksRes.data.filter((t: any) => t.status === 'completed' && t.assigned_to_id === res.data.id).length;
+                    const countRes = await axios.get(API_URL + "/api/v1/tasks/count", {
+                        params: { status: 'completed', assigned_to_id: res.data.id }
+                    });
+                    const completedCount = countRes.data.count;
                     setStats(s => ({ ...s, tasksCompleted: completedCount }));
                 }
             } catch (e) { }